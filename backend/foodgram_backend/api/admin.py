@@ -1,7 +1,35 @@
 from django.contrib import admin, messages
+from django.db import transaction
+from django.utils import timezone
 
+from .cache import bump_recipes_version
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
-                     ShoppingCart, Tag)
+                     ShoppingCart, Tag, Task)
+from .search import update_search_vectors
+from .utils import (get_amounts_delta, get_recipe_amounts, lock_recipes,
+                    update_shopping_lists, update_tags_masks)
+
+
+def get_buyers(recipe_id):
+    return list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+
+
+def snapshot_amounts(recipe_ids):
+    """Количества ингредиентов рецептов до правки, под блокировкой."""
+    lock_recipes(recipe_ids)
+    return {
+        recipe_id: get_recipe_amounts(recipe_id) for recipe_id in recipe_ids
+    }
+
+
+def update_buyers_lists(old_amounts):
+    """Переносит в списки покупок правки рецептов {recipe_id: amounts}."""
+    for recipe_id, amounts in old_amounts.items():
+        update_shopping_lists(get_buyers(recipe_id), get_amounts_delta(
+            amounts, get_recipe_amounts(recipe_id)
+        ))
 
 
 class IngredientInLine(admin.StackedInline):
@@ -25,6 +53,14 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInLine, TaginLine)
     filter_horizontal = ('tags', 'ingredients')
 
+    def save_related(self, request, form, formsets, change):
+        recipe_id = form.instance.pk
+        old_amounts = snapshot_amounts([recipe_id])
+        super().save_related(request, form, formsets, change)
+        update_buyers_lists(old_amounts)
+        update_search_vectors([recipe_id])
+        update_tags_masks([recipe_id])
+
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
@@ -33,6 +69,22 @@ class IngredientAdmin(admin.ModelAdmin):
 
 class RecipeIngredientAdmin(admin.ModelAdmin):
 
+    def ingredients_changed(self, old_amounts):
+        recipe_ids = list(old_amounts)
+        update_buyers_lists(old_amounts)
+        update_search_vectors(recipe_ids)
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+        transaction.on_commit(bump_recipes_version)
+
+    def save_model(self, request, obj, form, change):
+        old_amounts = snapshot_amounts(
+            {obj.recipe_id, form.initial.get('recipe', obj.recipe_id)}
+        )
+        super().save_model(request, obj, form, change)
+        self.ingredients_changed(old_amounts)
+
     def delete_model(self, request, obj):
         queryset = RecipeIngredient.objects.filter(recipe=obj.recipe)
         if queryset.count() == 1:
@@ -40,11 +92,31 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
             message = 'You cannot delete the only one ingredient!'
             self.message_user(request, message, level=messages.ERROR)
         else:
+            old_amounts = snapshot_amounts([obj.recipe_id])
             obj.delete()
+            self.ingredients_changed(old_amounts)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        old_amounts = snapshot_amounts(
+            set(queryset.values_list('recipe_id', flat=True))
+        )
+        super().delete_queryset(request, queryset)
+        self.ingredients_changed(old_amounts)
 
 
 class RecipeTagAdmin(admin.ModelAdmin):
 
+    def tags_changed(self, recipe_ids):
+        update_tags_masks(recipe_ids)
+        transaction.on_commit(bump_recipes_version)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.tags_changed(
+            {obj.recipe_id, form.initial.get('recipe', obj.recipe_id)}
+        )
+
     def delete_model(self, request, obj):
         queryset = RecipeTag.objects.filter(recipe=obj.recipe)
         if queryset.count() == 1:
@@ -53,6 +125,32 @@ class RecipeTagAdmin(admin.ModelAdmin):
             self.message_user(request, message, level=messages.ERROR)
         else:
             obj.delete()
+            self.tags_changed([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.tags_changed(recipe_ids)
+
+
+class ShoppingCartAdmin(admin.ModelAdmin):
+
+    def save_model(self, request, obj, form, change):
+        lock_recipes({obj.recipe_id, form.initial.get('recipe')} - {None})
+        if change:
+            update_shopping_lists([form.initial['user']], {
+                ingredient_id: -amount for ingredient_id, amount
+                in get_recipe_amounts(form.initial['recipe']).items()
+            })
+        super().save_model(request, obj, form, change)
+        update_shopping_lists(
+            [obj.user_id], get_recipe_amounts(obj.recipe_id)
+        )
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'attempts', 'available_at', 'failed')
+    list_filter = ('failed', 'name')
 
 
 admin.site.register(Tag)
@@ -61,4 +159,5 @@ admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(RecipeTag, RecipeTagAdmin)
 admin.site.register(Favorite)
-admin.site.register(ShoppingCart)
+admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,130 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from rest_framework import status
+from rest_framework.response import Response
+
+from .constants import RECIPE_CACHE_TTL
+
+RECIPES_VERSION_KEY = 'recipes:version'
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def is_shared_cache():
+    """Видят ли удаление ключа из кэша все процессы gunicorn."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+def get_recipes_version():
+    """Текущая версия рецептов; меняется при любой записи в них."""
+    return cache.get_or_set(RECIPES_VERSION_KEY, time.time_ns, None)
+
+
+def bump_recipes_version():
+    cache.set(RECIPES_VERSION_KEY, time.time_ns(), None)
+
+
+def get_response_cache_key(request, version):
+    """Ключ ответа: версия, адрес и отсортированные параметры запроса."""
+    params = sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    )
+    url = request.build_absolute_uri(request.path)
+    digest = hashlib.md5(
+        f'{url}?{urlencode(params, doseq=True)}'.encode()
+    ).hexdigest()
+    return f'recipes:{version}:{digest}'
+
+
+def get_request_recipes_version(request):
+    """Версия рецептов, прочитанная из кэша один раз за запрос."""
+    if request is None:
+        return get_recipes_version()
+    version = getattr(request, '_recipes_version', None)
+    if version is None:
+        version = request._recipes_version = get_recipes_version()
+    return version
+
+
+def get_recipe_cache_key(request, recipe):
+    """Ключ общего для всех зрителей представления рецепта.
+
+    Отметка updated_at берётся из уже загруженной строки, поэтому правка
+    рецепта или профиля его автора сменит ключ во всех процессах, даже
+    с локальным кэшем.
+    """
+    host = request.build_absolute_uri('/') if request else ''
+    stamp = recipe.updated_at.timestamp()
+    version = get_request_recipes_version(request)
+    return f'recipe:{version}:{host}:{recipe.id}:{stamp}'
+
+
+def load_recipe_documents(request, recipes, *lookups):
+    """Достаёт документы рецептов из кэша одним get_many.
+
+    lookups подгружаются только для промахов, поэтому страница, целиком
+    найденная в кэше, обходится без prefetch-запросов.
+    """
+    keys = {get_recipe_cache_key(request, recipe): recipe
+            for recipe in recipes}
+    documents = cache.get_many(list(keys))
+    for key, recipe in keys.items():
+        recipe.cached_document = documents.get(key)
+    prefetch_related_objects(
+        [recipe for recipe in recipes if recipe.cached_document is None],
+        *lookups
+    )
+    return recipes
+
+
+def get_cached_representation(request, recipe, serialize):
+    """Представление рецепта из кэша или из serialize() при промахе."""
+    key = get_recipe_cache_key(request, recipe)
+    if hasattr(recipe, 'cached_document'):
+        data = recipe.cached_document
+    else:
+        data = cache.get(key)
+    if data is None:
+        data = serialize()
+        cache.set(key, data, RECIPE_CACHE_TTL)
+    return data
+
+
+class AnonymousResponseCacheMixin:
+    """Кэширует list и retrieve для анонимных пользователей.
+
+    Старые ключи перестают использоваться после смены версии рецептов.
+    Таймаут ограничивает устаревание там, где версия не меняется:
+    профиль автора и локальный кэш других процессов.
+    """
+
+    cache_timeout = RECIPE_CACHE_TTL
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = get_response_cache_key(request, get_recipes_version())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -4,3 +4,35 @@ MAX_SLUG_LENGTH = 50
 LIMIT_TEXT = 30
 MAX_VALUE = 1440
 MIN_VALUE = 1
+SHOPPING_CART_FILENAME = 'shopcart'
+DEFAULT_SHOPPING_CART_FORMAT = 'txt'
+CATALOG_SNAPSHOT_TTL = 300
+MAX_TAGS = 63
+SEARCH_CONFIG = 'russian'
+FUZZY_SEARCH_LIMIT = 10
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+RECIPE_CACHE_TTL = 60
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 25_000_000
+IMAGE_QUALITY = 85
+THUMBNAIL_SIZES = (300, 600)
+THUMBNAILS_DIR = 'users/images/thumbs/'
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10
+TASK_VISIBILITY_TIMEOUT = 300
+TASK_BATCH_SIZE = 10
+TASK_POLL_INTERVAL = 1
+TASK_DB_RETRY_MAX_DELAY = 60
+SHORT_LINK_CACHE_SIZE = 10000
+SHORT_LINK_FLUSH_INTERVAL = 10
+AUTH_TOKEN_CACHE_TTL = 300
+METRICS_FLUSH_INTERVAL = 5
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+RESPONSE_SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304
+)
+DEBUG_TIMING_HEADER = 'HTTP_X_DEBUG_TIMING'
+PROFILE_INTERVAL = 0.005
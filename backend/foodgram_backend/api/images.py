@@ -0,0 +1,121 @@
+import base64
+import binascii
+import hashlib
+import io
+import warnings
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+from .constants import (IMAGE_QUALITY, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS,
+                        THUMBNAIL_SIZES, THUMBNAILS_DIR)
+
+OUTPUT_FORMATS = {
+    'JPEG': ('JPEG', 'jpg'),
+    'PNG': ('PNG', 'png'),
+    'WEBP': ('WEBP', 'webp'),
+    'GIF': ('PNG', 'png'),
+}
+
+
+def decode_base64_image(imgstr):
+    """Декодирует base64, не выходя за MAX_IMAGE_BYTES."""
+    if len(imgstr) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise serializers.ValidationError(
+            f'Image must not exceed {MAX_IMAGE_BYTES} bytes.'
+        )
+    try:
+        return base64.b64decode(imgstr, validate=True)
+    except binascii.Error:
+        raise serializers.ValidationError('Invalid base64 image data.')
+
+
+def open_image(content):
+    """Открывает картинку, проверив формат и размер до декодирования."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(io.BytesIO(content))
+    except UnidentifiedImageError:
+        raise serializers.ValidationError('Upload a valid image.')
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise serializers.ValidationError(
+            f'Image must not exceed {MAX_IMAGE_PIXELS} pixels.'
+        )
+    if image.format not in OUTPUT_FORMATS:
+        raise serializers.ValidationError(
+            f'Image format {image.format} is not supported.'
+        )
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        raise serializers.ValidationError(
+            f'Image must not exceed {MAX_IMAGE_PIXELS} pixels.'
+        )
+    return image
+
+
+def encode_image(image, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(
+        buffer, image_format, quality=IMAGE_QUALITY, optimize=True
+    )
+    return buffer.getvalue()
+
+
+def strip_metadata(image):
+    """Поворачивает по EXIF и отбрасывает метаданные."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    image.info = {}
+    return image
+
+
+def clean_image(content):
+    """Перекодированная без метаданных картинка с именем по хэшу."""
+    image = open_image(content)
+    image_format, extension = OUTPUT_FORMATS[image.format]
+    data = encode_image(strip_metadata(image), image_format)
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    return ContentFile(data, name=f'{digest}.{extension}')
+
+
+def save_thumbnail(name, data):
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def make_thumbnails(image_file):
+    """Миниатюры WebP и JPEG/PNG для каждого размера из THUMBNAIL_SIZES.
+
+    Возвращает словарь {размер: {'webp': путь, 'fallback': путь}}.
+    Имена строятся по хэшу исходника, поэтому одинаковые картинки
+    обрабатываются один раз.
+    """
+    with image_file.open('rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    image = strip_metadata(open_image(content))
+    has_alpha = image.mode == 'RGBA'
+    fallback_format, fallback_extension = (
+        ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+    )
+    thumbnails = {}
+    for size in THUMBNAIL_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        prefix = f'{THUMBNAILS_DIR}{digest}_{size}'
+        thumbnails[str(size)] = {
+            'webp': save_thumbnail(
+                f'{prefix}.webp', encode_image(thumbnail, 'WEBP')
+            ),
+            'fallback': save_thumbnail(
+                f'{prefix}.{fallback_extension}',
+                encode_image(thumbnail, fallback_format)
+            ),
+        }
+    return thumbnails
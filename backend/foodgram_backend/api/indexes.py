@@ -0,0 +1,93 @@
+import heapq
+import re
+from bisect import bisect_left
+from collections import Counter
+
+from .constants import FUZZY_SEARCH_LIMIT, TRIGRAM_SIMILARITY_THRESHOLD
+from .models import Ingredient
+from .snapshots import InMemorySnapshot
+
+
+class IngredientPrefixIndex(InMemorySnapshot):
+    """Отсортированный по casefold-имени каталог ингредиентов в памяти."""
+
+    def build(self):
+        rows = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).iterator()
+        entries = sorted(
+            (
+                (name.casefold(), {
+                    'id': pk, 'name': name, 'measurement_unit': unit
+                })
+                for pk, name, unit in rows
+            ),
+            key=lambda entry: (entry[0], entry[1]['id'])
+        )
+        return (
+            [key for key, _ in entries],
+            [ingredient for _, ingredient in entries]
+        )
+
+    def search(self, prefix):
+        keys, ingredients = self.get()
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return ingredients[start:end]
+
+
+def get_trigrams(text):
+    """Триграммы слов строки так же, как их считает pg_trgm."""
+    trigrams = set()
+    for word in re.findall(r'\w+', text.casefold()):
+        word = f'  {word} '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+class IngredientTrigramIndex(InMemorySnapshot):
+    """Инвертированный триграммный индекс ингредиентов в памяти."""
+
+    def build(self):
+        ingredients = []
+        sizes = []
+        postings = {}
+        for pk, name, unit in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).iterator():
+            trigrams = get_trigrams(name)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(len(ingredients))
+            ingredients.append({
+                'id': pk, 'name': name, 'measurement_unit': unit
+            })
+            sizes.append(len(trigrams))
+        return ingredients, sizes, postings
+
+    def search(self, text, limit=FUZZY_SEARCH_LIMIT,
+               threshold=TRIGRAM_SIMILARITY_THRESHOLD):
+        ingredients, sizes, postings = self.get()
+        trigrams = get_trigrams(text)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(postings.get(trigram, ()))
+        scored = (
+            (count / (len(trigrams) + sizes[position] - count), position)
+            for position, count in shared.items()
+        )
+        best = heapq.nsmallest(
+            limit,
+            (
+                (-similarity, ingredients[position]['name'], position)
+                for similarity, position in scored
+                if similarity >= threshold
+            )
+        )
+        return [ingredients[position] for _, _, position in best]
+
+
+ingredient_index = IngredientPrefixIndex()
+ingredient_trigram_index = IngredientTrigramIndex()
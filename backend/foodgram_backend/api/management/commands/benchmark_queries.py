@@ -0,0 +1,240 @@
+import random
+import re
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                        RecipeTag, ShoppingCart, ShoppingListItem, Tag)
+from api.utils import get_tags_mask, update_tags_masks
+from users.models import User
+
+BENCHMARK_PREFIX = 'bench'
+BENCHMARK_INDEXES = (
+    (Recipe, Recipe._meta.indexes),
+    (RecipeTag, RecipeTag._meta.indexes),
+)
+
+
+@contextmanager
+def explicit_pub_date():
+    """Позволяет задать pub_date при bulk_create вместо auto_now_add."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Заполняет БД синтетическими данными и сравнивает планы '
+            'горячих запросов без индексов и с индексами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не откатывать синтетические данные после замеров'
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Печатать полный план каждого запроса'
+        )
+
+    def seed(self, options):
+        """Создаёт данные с уникальным для запуска префиксом.
+
+        С --keep данные остаются, поэтому повторный запуск не должен
+        пересекаться с ними по именам пользователей и рецептов.
+        """
+        rnd = random.Random(0)
+        prefix = f'{BENCHMARK_PREFIX}{time.time_ns()}-'
+        User.objects.bulk_create(
+            User(
+                username=f'{prefix}{i}',
+                email=f'{prefix}{i}@example.com',
+                first_name=BENCHMARK_PREFIX,
+                last_name=BENCHMARK_PREFIX
+            )
+            for i in range(options['users'])
+        )
+        users = list(User.objects.filter(
+            username__startswith=prefix
+        ).values_list('id', flat=True))
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'{BENCHMARK_PREFIX}{bit}',
+                slug=f'{BENCHMARK_PREFIX}{bit}',
+                bit=bit
+            )
+            for bit in Tag.get_free_bits()[:8]
+        )
+        tags = list(Tag.objects.values_list('id', flat=True))
+        if Ingredient.objects.count() < 100:
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f'{BENCHMARK_PREFIX} {i}', measurement_unit='г'
+                    )
+                    for i in range(2000)
+                ),
+                ignore_conflicts=True
+            )
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        now = timezone.now()
+        with explicit_pub_date():
+            Recipe.objects.bulk_create(
+                (
+                    Recipe(
+                        author_id=rnd.choice(users),
+                        name=f'{prefix}{i}',
+                        text=BENCHMARK_PREFIX,
+                        image='users/images/bench.png',
+                        cooking_time=rnd.randint(1, 120),
+                        pub_date=now - timedelta(minutes=i)
+                    )
+                    for i in range(options['recipes'])
+                ),
+                batch_size=1000
+            )
+        recipes = list(Recipe.objects.filter(
+            name__startswith=prefix
+        ).values_list('id', flat=True))
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe, ingredient_id=ingredient,
+                    amount=rnd.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient in rnd.sample(ingredients, min(
+                    options['ingredients_per_recipe'], len(ingredients)
+                ))
+            ),
+            batch_size=5000
+        )
+        RecipeTag.objects.bulk_create(
+            (
+                RecipeTag(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in rnd.sample(tags, min(2, len(tags)))
+            ),
+            batch_size=5000
+        )
+        update_tags_masks(recipes)
+        for model, field in ((Favorite, 'favorite_id'),
+                             (ShoppingCart, 'recipe_id')):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user, **{field: recipe})
+                    for user in users
+                    for recipe in rnd.sample(recipes, min(20, len(recipes)))
+                ),
+                batch_size=5000
+            )
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        self.stdout.write(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}'
+        )
+        return rnd.choice(users), rnd.choice(recipes)
+
+    def get_queries(self, user_id, recipe_id):
+        recipe = Recipe.objects.get(id=recipe_id)
+        tag = Tag.objects.filter(tag_for_recipe__recipe=recipe).first()
+        return {
+            'Лента, первая страница': Recipe.objects.order_by(
+                '-pub_date', '-id'
+            )[:6],
+            'Лента, страница 1000 (OFFSET)': Recipe.objects.order_by(
+                '-pub_date', '-id'
+            )[6000:6006],
+            'Лента, keyset-курсор': Recipe.objects.filter(
+                pub_date__lte=recipe.pub_date
+            ).exclude(
+                pub_date=recipe.pub_date, id__gte=recipe.id
+            ).order_by('-pub_date', '-id')[:6],
+            'Рецепты автора': Recipe.objects.filter(
+                author_id=recipe.author_id
+            ).order_by('-pub_date')[:6],
+            'Фильтр по тегу (JOIN)': Recipe.objects.filter(
+                tags__slug=tag.slug
+            ).distinct().order_by('-pub_date')[:6],
+            'Фильтр по тегу (маска)': Recipe.objects.alias(
+                matched_tags=F('tags_mask').bitand(get_tags_mask([tag]))
+            ).exclude(matched_tags=0).order_by('-pub_date')[:6],
+            'Избранное пользователя': Recipe.objects.filter(
+                favorite__user_id=user_id
+            ).order_by('-pub_date')[:6],
+            'Флаг «в избранном»': Favorite.objects.filter(
+                user_id=user_id, favorite_id=recipe_id
+            ),
+            'Флаг «в корзине»': ShoppingCart.objects.filter(
+                user_id=user_id, recipe_id=recipe_id
+            ),
+            'Список покупок': ShoppingListItem.objects.filter(
+                user_id=user_id
+            ).order_by('ingredient__name'),
+        }
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        if connection.vendor == 'postgresql':
+            plan = queryset.explain(analyze=True)
+            execution = re.search(r'Execution Time: ([\d.]+) ms', plan)
+            if execution:
+                return float(execution.group(1)), plan
+        else:
+            plan = queryset.explain()
+        return min(timings), plan
+
+    def run_queries(self, queries, options):
+        return {
+            name: self.measure(queryset, options['repeat'])
+            for name, queryset in queries.items()
+        }
+
+    def drop_indexes(self):
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model, indexes in BENCHMARK_INDEXES:
+                for index in indexes:
+                    cursor.execute(str(index.remove_sql(model, editor)))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_id, recipe_id = self.seed(options)
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute('ANALYZE')
+            queries = self.get_queries(user_id, recipe_id)
+            with transaction.atomic():
+                self.drop_indexes()
+                before = self.run_queries(queries, options)
+                transaction.set_rollback(True)
+            after = self.run_queries(queries, options)
+            self.stdout.write(f'{"Запрос":<32}{"без индексов":>14}'
+                              f'{"с индексами":>14}')
+            for name, (timing, plan) in after.items():
+                self.stdout.write(
+                    f'{name:<32}{before[name][0]:>11.2f} мс'
+                    f'{timing:>11.2f} мс'
+                )
+                if options['plans']:
+                    self.stdout.write(f'  без индексов:\n{before[name][1]}')
+                    self.stdout.write(f'  с индексами:\n{plan}')
+            if not options['keep']:
+                transaction.set_rollback(True)
@@ -0,0 +1,187 @@
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.constants import MAX_TAGS
+from api.models import Ingredient, Tag
+from api.utils import Echo
+
+CATALOGS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit')),
+    'tags': (Tag, ('name', 'slug')),
+}
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_MAX_BUFFER_SIZE = 16 * JSON_CHUNK_SIZE
+JSON_SEPARATORS = '[,] \t\r\n'
+
+
+class CopyStream:
+    """Файлоподобный объект, отдающий строки CSV для COPY FROM STDIN."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.writer = csv.writer(Echo())
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += self.writer.writerow(row)
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты или теги из CSV- или JSON-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=Path, help='Путь к файлу каталога')
+        parser.add_argument(
+            '--catalog', choices=CATALOGS, default='ingredients',
+            help='Какую модель заполнять'
+        )
+        parser.add_argument(
+            '--format', dest='file_format', choices=('csv', 'json'),
+            help='Формат файла; по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки для bulk_create'
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL'
+        )
+
+    def read_csv(self, file, fields):
+        for row in csv.reader(file):
+            if tuple(row) == fields:
+                continue
+            yield row
+
+    def read_json(self, file, fields):
+        decoder = json.JSONDecoder()
+        buffer = ''
+        for chunk in iter(lambda: file.read(JSON_CHUNK_SIZE), ''):
+            buffer += chunk
+            position = 0
+            while True:
+                while (position < len(buffer)
+                       and buffer[position] in JSON_SEPARATORS):
+                    position += 1
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break
+                yield [item.get(field) for field in fields]
+            buffer = buffer[position:]
+            if len(buffer) > JSON_MAX_BUFFER_SIZE:
+                raise CommandError('Файл содержит некорректный JSON')
+        if buffer.strip(JSON_SEPARATORS):
+            raise CommandError('Файл содержит некорректный JSON')
+
+    def clean_rows(self, rows, model, fields):
+        max_lengths = [
+            model._meta.get_field(field).max_length for field in fields
+        ]
+        for row in rows:
+            self.read_count += 1
+            if len(row) != len(fields):
+                self.skipped_count += 1
+                continue
+            row = [str(value or '').strip() for value in row]
+            if not all(
+                0 < len(value) <= max_length
+                for value, max_length in zip(row, max_lengths)
+            ):
+                self.skipped_count += 1
+                continue
+            yield row
+
+    def load_bulk(self, model, fields, rows, batch_size):
+        batch = {}
+        for row in rows:
+            batch.setdefault(row[0], row)
+            if len(batch) >= batch_size:
+                self.save_batch(model, fields, batch)
+                batch = {}
+        self.save_batch(model, fields, batch)
+
+    def save_batch(self, model, fields, batch):
+        objects = [model(**dict(zip(fields, row))) for row in batch.values()]
+        if model is Tag:
+            existing = set(Tag.objects.filter(
+                name__in=batch
+            ).values_list('name', flat=True))
+            objects = [tag for tag in objects if tag.name not in existing]
+            free_bits = Tag.get_free_bits()
+            if len(objects) > len(free_bits):
+                raise CommandError(
+                    f'Нельзя создать больше {MAX_TAGS} тегов'
+                )
+            for tag, bit in zip(objects, free_bits):
+                tag.bit = bit
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        if self.verbosity > 1:
+            self.stdout.write(f'Прочитано строк: {self.read_count}')
+
+    def load_copy(self, model, fields, rows):
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(field) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE catalog_staging ('
+                + ', '.join(f'{quote(field)} text' for field in fields)
+                + ') ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                f'COPY catalog_staging ({columns}) FROM STDIN WITH CSV',
+                CopyStream(rows)
+            )
+            cursor.execute(
+                f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+                f'SELECT DISTINCT ON ({quote(fields[0])}) {columns} '
+                f'FROM catalog_staging ON CONFLICT DO NOTHING'
+            )
+
+    def handle(self, *args, **options):
+        model, fields = CATALOGS[options['catalog']]
+        path = options['path']
+        file_format = options['file_format'] or path.suffix.lstrip('.')
+        if file_format not in ('csv', 'json'):
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        self.verbosity = options['verbosity']
+        self.read_count = 0
+        self.skipped_count = 0
+        use_copy = (
+            connection.vendor == 'postgresql'
+            and not options['no_copy']
+            and model is not Tag
+        )
+        started = time.monotonic()
+        initial_count = model.objects.count()
+        with open(path, encoding='utf-8', newline='') as file:
+            reader = self.read_csv if file_format == 'csv' else self.read_json
+            rows = self.clean_rows(reader(file, fields), model, fields)
+            with transaction.atomic():
+                if use_copy:
+                    self.load_copy(model, fields, rows)
+                else:
+                    self.load_bulk(
+                        model, fields, rows, options['batch_size']
+                    )
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {self.read_count}, '
+            f'пропущено: {self.skipped_count}, '
+            f'добавлено: {model.objects.count() - initial_count} '
+            f'за {elapsed:.2f} с ({self.read_count / elapsed:.0f} строк/с)'
+        ))
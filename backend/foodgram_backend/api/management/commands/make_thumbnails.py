@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.images import make_thumbnails
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать миниатюры и для рецептов, у которых они есть'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only('id', 'image')
+        if not options['all']:
+            recipes = recipes.filter(thumbnails={})
+        processed = failed = 0
+        for recipe in recipes.iterator():
+            try:
+                thumbnails = make_thumbnails(recipe.image)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.id}: {error}')
+                continue
+            Recipe.objects.filter(pk=recipe.pk).update(
+                thumbnails=thumbnails, updated_at=timezone.now()
+            )
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры созданы для рецептов: {processed}, ошибок: {failed}'
+        ))
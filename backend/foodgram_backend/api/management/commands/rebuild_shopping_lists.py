@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from api.models import RecipeIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает списки покупок по содержимому корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу с корзинами, ничего не меняя'
+        )
+
+    def get_live_totals(self):
+        totals = RecipeIngredient.objects.filter(
+            recipe__recipe__isnull=False
+        ).values(
+            'recipe__recipe__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+        return {
+            (row['recipe__recipe__user'], row['ingredient']): row['total']
+            for row in totals.iterator()
+        }
+
+    def get_stored_totals(self):
+        return {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            ).iterator()
+        }
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            live = self.get_live_totals()
+            stored = self.get_stored_totals()
+            mismatches = {
+                key for key in live.keys() | stored.keys()
+                if live.get(key) != stored.get(key)
+            }
+            if options['check']:
+                if mismatches:
+                    raise CommandError(
+                        f'Расхождений в списках покупок: {len(mismatches)}'
+                    )
+                self.stdout.write(self.style.SUCCESS(
+                    'Списки покупок совпадают с корзинами'
+                ))
+                return
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=total_amount
+                    )
+                    for (user_id, ingredient_id), total_amount in live.items()
+                ),
+                batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, исправлено позиций: '
+            f'{len(mismatches)}'
+        ))
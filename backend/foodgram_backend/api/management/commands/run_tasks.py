@@ -0,0 +1,73 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from api.constants import (TASK_BATCH_SIZE, TASK_DB_RETRY_MAX_DELAY,
+                           TASK_POLL_INTERVAL, TASK_VISIBILITY_TIMEOUT)
+from api.tasks import claim_tasks, run_task
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди отложенных задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и завершиться'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=TASK_BATCH_SIZE,
+            help='Сколько задач забирать за раз'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=TASK_POLL_INTERVAL,
+            help='Пауза в секундах, когда очередь пуста'
+        )
+        parser.add_argument(
+            '--visibility-timeout',
+            type=int,
+            default=TASK_VISIBILITY_TIMEOUT,
+            help='Через сколько секунд задача упавшего воркера вернётся'
+        )
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        retry_delay = options['poll_interval']
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    tasks = claim_tasks(
+                        options['batch_size'], options['visibility_timeout']
+                    )
+                    for queued in tasks:
+                        if run_task(queued):
+                            done += 1
+                        else:
+                            failed += 1
+                except OperationalError:
+                    logger.exception(
+                        'БД недоступна, повтор через %s с', retry_delay
+                    )
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, TASK_DB_RETRY_MAX_DELAY)
+                    continue
+                retry_delay = options['poll_interval']
+                if options['once'] and not tasks:
+                    break
+                if not tasks:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {done}, с ошибкой: {failed}'
+        ))
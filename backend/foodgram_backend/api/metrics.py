@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .constants import (LATENCY_BUCKETS, METRICS_FLUSH_INTERVAL,
+                        QUERY_COUNT_BUCKETS, RESPONSE_SIZE_BUCKETS)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': (
+        'Request latency in seconds.', LATENCY_BUCKETS
+    ),
+    'http_request_sql_queries': (
+        'SQL queries executed per request.', QUERY_COUNT_BUCKETS
+    ),
+    'http_request_sql_duration_seconds': (
+        'Time spent in SQL per request in seconds.', LATENCY_BUCKETS
+    ),
+    'http_response_size_bytes': (
+        'Response body size in bytes.', RESPONSE_SIZE_BUCKETS
+    ),
+}
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def escape_label(value):
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+class MetricsStore:
+    """Гистограммы запросов процесса с общим файловым хранилищем.
+
+    Каждый процесс gunicorn не чаще раза в METRICS_FLUSH_INTERVAL секунд
+    атомарно перезаписывает свой файл в METRICS_DIR, а эндпоинт метрик
+    суммирует файлы всех процессов. Счётчики завершившихся процессов
+    переносятся в файл процесса, обслужившего эндпоинт, а их файлы
+    удаляются: счётчики не уменьшаются, а файлы не копятся.
+    """
+
+    def __init__(self, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pid = None
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.path = Path(settings.METRICS_DIR) / (
+            f'metrics-{self.pid}-{time.time_ns()}.json'
+        )
+        self.series = {}
+        self.flushed_at = time.monotonic()
+
+    def observe(self, name, view, method, value):
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            values = self.series.setdefault(
+                f'{name}|{view}|{method}', [0] * len(buckets) + [0, 0]
+            )
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    values[position] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            self.flushed_at = time.monotonic()
+            data = json.dumps(self.series)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix('.tmp')
+        temporary.write_text(data)
+        os.replace(temporary, self.path)
+
+    def absorb_finished(self):
+        """Забирает счётчики процессов, которых уже нет.
+
+        Файл сначала переименовывается: из нескольких процессов его
+        заберёт только один. Возвращает забранные файлы, которые нужно
+        удалить после flush().
+        """
+        claimed = []
+        for path in self.path.parent.glob('metrics-*'):
+            try:
+                pid = int(path.name.split('-')[1])
+            except (IndexError, ValueError):
+                continue
+            if pid == os.getpid() or is_running(pid):
+                continue
+            claim = path.with_name(f'claimed-{os.getpid()}-{path.name}')
+            try:
+                os.rename(path, claim)
+                series = (
+                    json.loads(claim.read_text())
+                    if path.suffix == '.json' else {}
+                )
+            except (OSError, ValueError):
+                continue
+            claimed.append(claim)
+            with self.lock:
+                for key, values in series.items():
+                    current = self.series.setdefault(key, [0] * len(values))
+                    for position, value in enumerate(values):
+                        current[position] += value
+        return claimed
+
+    def collect(self):
+        """Сумма гистограмм всех процессов."""
+        self.flush()
+        claimed = self.absorb_finished()
+        if claimed:
+            self.flush()
+            for path in claimed:
+                path.unlink(missing_ok=True)
+        total = {}
+        for path in self.path.parent.glob('metrics-*.json'):
+            try:
+                series = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for key, values in series.items():
+                current = total.setdefault(key, [0] * len(values))
+                for position, value in enumerate(values):
+                    current[position] += value
+        return total
+
+    def render(self):
+        """Гистограммы в текстовом формате Prometheus."""
+        series = self.collect()
+        lines = []
+        for name, (description, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for key in sorted(series):
+                metric, view, method = key.split('|', 2)
+                if metric != name:
+                    continue
+                values = series[key]
+                labels = (
+                    f'view="{escape_label(view)}",'
+                    f'method="{escape_label(method)}"'
+                )
+                cumulative = 0
+                for bound, count in zip(buckets, values):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'{name}_bucket{{{labels},le="+Inf"}} {values[-1]}'
+                )
+                lines.append(f'{name}_sum{{{labels}}} {values[-2]}')
+                lines.append(f'{name}_count{{{labels}}} {values[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics_store = MetricsStore()
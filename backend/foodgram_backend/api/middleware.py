@@ -0,0 +1,274 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .constants import DEBUG_TIMING_HEADER
+from .metrics import metrics_store
+from .profiling import sampler, write_profile
+from .slow_queries import current_view
+
+logger = logging.getLogger(__name__)
+
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class QueryRecorder:
+    """Execute-обёртка, считающая SQL-запросы и время на них.
+
+    С trace=True сохраняет и сами запросы с параметрами и временем.
+    """
+
+    def __init__(self, trace=False):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = [] if trace else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if self.queries is not None:
+                self.queries.append((sql, repr(params), duration))
+
+    def get_trace(self):
+        """Запросы, их время и повторы: одинаковый SQL и точные дубли."""
+        same_sql = Counter(sql for sql, _, _ in self.queries)
+        same_query = Counter((sql, params) for sql, params, _ in self.queries)
+        return {
+            'count': self.count,
+            'duration_ms': round(self.duration * 1000, 3),
+            'queries': [
+                {
+                    'sql': sql,
+                    'params': params,
+                    'duration_ms': round(duration * 1000, 3)
+                }
+                for sql, params, duration in self.queries
+            ],
+            'similar': [
+                {'sql': sql, 'count': count}
+                for sql, count in same_sql.most_common() if count > 1
+            ],
+            'duplicates': [
+                {'sql': sql, 'params': params, 'count': count}
+                for (sql, params), count in same_query.most_common()
+                if count > 1
+            ],
+        }
+
+
+class MetricsMiddleware:
+    """Пишет в metrics_store время, SQL и размер ответа каждого запроса.
+
+    Серии различаются именем URL и методом; запросы без совпавшего URL
+    собираются в view="unresolved", чтобы не плодить серии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        method = request.method if request.method in KNOWN_METHODS else 'OTHER'
+        metrics_store.observe(
+            'http_request_duration_seconds', view, method, duration
+        )
+        metrics_store.observe(
+            'http_request_sql_queries', view, method, recorder.count
+        )
+        metrics_store.observe(
+            'http_request_sql_duration_seconds', view, method,
+            recorder.duration
+        )
+        if not response.streaming:
+            metrics_store.observe(
+                'http_response_size_bytes', view, method,
+                len(response.content)
+            )
+        metrics_store.maybe_flush()
+        return response
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing и трассировка SQL для персонала.
+
+    Включается заголовком X-Debug-Timing. Время делится на db (SQL),
+    serialize (код представления и сериализация без SQL), render и
+    total. Со значением заголовка sql в JSON-ответ добавляется ключ
+    _sql_trace; ответ-список при этом оборачивается в {"data": ...}.
+    Потоковый ответ собирается целиком, и его генерация идёт в render.
+    Персонал определяется по токену до вызова представления, так что
+    запросы остальных пользователей не записываются вовсе.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get(DEBUG_TIMING_HEADER)
+        if not mode or not self.is_staff(request):
+            return self.get_response(request)
+        recorder = QueryRecorder(trace=mode == 'sql')
+        request.server_timing = {'recorder': recorder}
+        timings = request.server_timing
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+            if 'view_started' in timings and 'view_time' not in timings:
+                self.finish_view(timings)
+            if response.streaming:
+                render_started = time.perf_counter()
+                response.streaming_content = [
+                    b''.join(response.streaming_content)
+                ]
+                timings['render'] = time.perf_counter() - render_started
+        total = time.perf_counter() - started
+        view_time = timings.get('view_time', 0.0)
+        view_db = timings.get('view_db', 0.0)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={recorder.duration * 1000:.3f};'
+            f'desc="{recorder.count} queries"',
+            f'serialize;dur={max(view_time - view_db, 0) * 1000:.3f}',
+            f'render;dur={timings.get("render", 0.0) * 1000:.3f}',
+            f'total;dur={total * 1000:.3f}',
+        ))
+        if recorder.queries is not None:
+            self.add_trace(response, recorder.get_trace())
+        return response
+
+    def is_staff(self, request):
+        """Аутентифицирует запрос классами DRF и проверяет is_staff."""
+        drf_request = Request(request)
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            try:
+                result = authenticator().authenticate(drf_request)
+            except APIException:
+                return False
+            if result is not None:
+                return result[0].is_staff
+        return False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, 'server_timing', None)
+        if timings is not None:
+            timings['view_started'] = time.perf_counter()
+            timings['db_started'] = timings['recorder'].duration
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, 'server_timing', None)
+        if timings is None or 'view_started' not in timings:
+            return response
+        self.finish_view(timings)
+        render_started = time.perf_counter()
+
+        def finish_render(rendered):
+            timings['render'] = time.perf_counter() - render_started
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+    def finish_view(self, timings):
+        timings['view_time'] = time.perf_counter() - timings['view_started']
+        timings['view_db'] = (
+            timings['recorder'].duration - timings['db_started']
+        )
+
+    def add_trace(self, response, trace):
+        """Добавляет трассировку в несжатый JSON; иначе ответ не трогает."""
+        if (response.streaming
+                or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith(
+                    'application/json'
+                )):
+            return
+        try:
+            data = json.loads(response.content or 'null')
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            data = {'data': data}
+        data['_sql_trace'] = trace
+        response.content = json.dumps(data, ensure_ascii=False)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = len(response.content)
+
+
+class ProfilingMiddleware:
+    """Снимает стеки запросов семплирующим профайлером.
+
+    Профилируется доля PROFILE_SAMPLE_RATE запросов, а при заданном
+    PROFILE_SLOW_THRESHOLD — все запросы, но сохраняются только те, что
+    дольше порога. Профили пишутся в PROFILE_DIR в формате
+    collapsed-stack для flamegraph.pl и speedscope, хранятся последние
+    PROFILE_MAX_FILES файлов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.PROFILE_SAMPLE_RATE
+        if not sampled and not settings.PROFILE_SLOW_THRESHOLD:
+            return self.get_response(request)
+        thread_id = threading.get_ident()
+        sampler.start(thread_id)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop(thread_id)
+        duration = time.perf_counter() - started
+        slow = (
+            settings.PROFILE_SLOW_THRESHOLD
+            and duration >= settings.PROFILE_SLOW_THRESHOLD
+        )
+        if (sampled or slow) and stacks:
+            match = request.resolver_match
+            view = match.view_name if match else 'unresolved'
+            try:
+                write_profile(
+                    settings.PROFILE_DIR,
+                    f'{time.strftime("%Y%m%d-%H%M%S")}-{view}-'
+                    f'{round(duration * 1000)}ms-{time.time_ns()}',
+                    stacks,
+                    settings.PROFILE_MAX_FILES
+                )
+            except OSError:
+                logger.exception('Не удалось записать профиль запроса')
+        return response
+
+
+class QueryContextMiddleware:
+    """Запоминает имя представления для журнала медленных запросов."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_view.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_view.set(request.resolver_match.view_name)
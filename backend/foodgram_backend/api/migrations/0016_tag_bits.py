@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+def assign_tag_bits(apps, schema_editor):
+    Tag = apps.get_model('api', 'Tag')
+    tags = list(Tag.objects.order_by('id'))
+    if len(tags) > 63:
+        raise ValueError('Маска тегов вмещает не больше 63 тегов')
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ('bit',))
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    RecipeTag = apps.get_model('api', 'RecipeTag')
+    masks = {}
+    for recipe_id, bit in RecipeTag.objects.values_list(
+        'recipe_id', 'tag__bit'
+    ).order_by():
+        masks[recipe_id] = masks.get(recipe_id, 0) | (1 << bit)
+    Recipe.objects.bulk_update(
+        [Recipe(id=recipe_id, tags_mask=mask)
+         for recipe_id, mask in masks.items()],
+        ('tags_mask',),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_recipe_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Бит в маске тегов рецепта'),
+        ),
+        migrations.RunPython(assign_tag_bits, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True, verbose_name='Бит в маске тегов рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+    ]
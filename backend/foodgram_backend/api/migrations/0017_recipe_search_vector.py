@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:39
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+FILL_SEARCH_VECTORS = '''
+UPDATE api_recipe SET search_vector =
+    setweight(to_tsvector('russian', name), 'A')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(api_ingredient.name, ' ')
+        FROM api_recipeingredient
+        JOIN api_ingredient
+            ON api_ingredient.id = api_recipeingredient.ingredient_id
+        WHERE api_recipeingredient.recipe_id = api_recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector('russian', text), 'C')
+'''
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(FILL_SEARCH_VECTORS)
+    schema_editor.execute(
+        'CREATE INDEX recipe_search_vector_idx ON api_recipe '
+        'USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_tag_bits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
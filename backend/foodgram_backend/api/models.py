@@ -1,9 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 from api.constants import (LIMIT_TEXT, MAX_NAME_LENGTH, MAX_SLUG_LENGTH,
-                           MAX_VALUE, MIN_VALUE)
+                           MAX_TAGS, MAX_VALUE, MIN_VALUE)
 
 User = get_user_model()
 
@@ -41,6 +44,11 @@ class Tag(BaseModel):
         unique=True,
         verbose_name='Slug'
     )
+    bit = models.PositiveSmallIntegerField(
+        unique=True,
+        editable=False,
+        verbose_name='Бит в маске тегов рецепта'
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -50,6 +58,21 @@ class Tag(BaseModel):
     def __str__(self):
         return self.slug[:LIMIT_TEXT]
 
+    @classmethod
+    def get_free_bits(cls):
+        used = set(cls.objects.values_list('bit', flat=True))
+        return [bit for bit in range(MAX_TAGS) if bit not in used]
+
+    def clean(self):
+        if self.bit is None and not self.get_free_bits():
+            raise ValidationError(f'Нельзя создать больше {MAX_TAGS} тегов')
+
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            self.clean()
+            self.bit = self.get_free_bits()[0]
+        super().save(*args, **kwargs)
+
 
 class Recipe(BaseModel):
     author = models.ForeignKey(
@@ -85,11 +108,38 @@ class Recipe(BaseModel):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Маска тегов'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    thumbnails = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Миниатюры'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date'), name='recipe_author_date_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name[:LIMIT_TEXT]
@@ -151,6 +201,9 @@ class RecipeTag(models.Model):
                 fields=('recipe', 'tag'), name='recipe_tag_unique'
             )
         ]
+        indexes = [
+            models.Index(fields=('tag', 'recipe'), name='tag_recipe_idx')
+        ]
 
     def __str__(self):
         return (f'Рецепт "{self.recipe.name}" - '
@@ -203,3 +256,75 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return (f'Пользователь {self.user.username} - '
                 f'Рецепт в корзине "{self.recipe.name}"')
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.IntegerField(
+        default=0,
+        verbose_name='Общее количество'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'), name='unique_user_ingredient'
+            )
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+
+    def __str__(self):
+        return (f'Пользователь {self.user.username} - '
+                f'{self.ingredient.name} {self.total_amount}')
+
+
+class Task(models.Model):
+    name = models.CharField(
+        max_length=MAX_NAME_LENGTH,
+        verbose_name='Задача'
+    )
+    kwargs = models.JSONField(
+        default=dict,
+        verbose_name='Аргументы'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    available_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Доступна с'
+    )
+    failed = models.BooleanField(
+        default=False,
+        verbose_name='Провалена'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана'
+    )
+
+    class Meta:
+        ordering = ('available_at',)
+        indexes = [
+            models.Index(
+                fields=('failed', 'available_at'), name='task_queue_idx'
+            )
+        ]
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -12,3 +15,14 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return (request.method in permissions.SAFE_METHODS
                 or obj.author == request.user)
+
+
+class IsStaffOrMetricsToken(permissions.BasePermission):
+    """Доступ для персонала или по токену из METRICS_TOKEN."""
+    def has_permission(self, request, view):
+        token = request.META.get('HTTP_X_METRICS_TOKEN', '')
+        return (
+            request.user.is_staff
+            or bool(settings.METRICS_TOKEN)
+            and hmac.compare_digest(token, settings.METRICS_TOKEN)
+        )
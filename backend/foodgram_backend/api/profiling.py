@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from .constants import PROFILE_INTERVAL
+
+
+def collapse_stack(frame):
+    """Стек кадра в формате collapsed-stack: корень первым, через ';'."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        names.append(f'{module}:{code.co_name}:{code.co_firstlineno}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Фоновый поток, снимающий стеки потоков с активными запросами.
+
+    Раз в interval секунд берёт sys._current_frames() и считает стеки
+    зарегистрированных потоков; когда запросов нет, поток спит.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self, thread_id):
+        with self.lock:
+            self.active[thread_id] = Counter()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def stop(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            with self.lock:
+                idle = not self.active
+            if idle:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, stacks in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+
+
+def write_profile(directory, name, stacks, max_files):
+    """Пишет стеки в файл .folded и оставляет max_files новейших файлов.
+
+    Имена начинаются с отметки времени, поэтому возраст файлов берётся
+    из имени: stat() упал бы на файле, удалённом соседним процессом.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{name}.folded'
+    path.write_text(''.join(
+        f'{stack} {count}\n' for stack, count in stacks.most_common()
+    ))
+    profiles = sorted(directory.glob('*.folded'), key=lambda item: item.name)
+    for old in profiles[:-max_files]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+sampler = StackSampler()
@@ -0,0 +1,97 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Subquery, Value, When)
+from django.db.models.functions import Coalesce
+from rest_framework import filters
+
+from .constants import FUZZY_SEARCH_LIMIT, SEARCH_CONFIG
+from .models import Ingredient, Recipe, RecipeIngredient
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(recipes):
+    """Пересчитывает search_vector: название, ингредиенты, описание."""
+    if not is_postgresql():
+        return
+    ingredient_names = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    Recipe.objects.filter(pk__in=recipes).update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(Subquery(ingredient_names), Value('')),
+            weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def search_recipes(queryset, text):
+    """Полнотекстовый поиск с ранжированием по релевантности.
+
+    Без PostgreSQL каждое слово ищется через icontains в названии,
+    описании и ингредиентах, а совпадения в названии ранжируются выше.
+    """
+    if is_postgresql():
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date')
+    words = text.split()
+    for word in words:
+        queryset = queryset.filter(
+            Q(name__icontains=word)
+            | Q(text__icontains=word)
+            | Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=word
+            ))
+        )
+    return queryset.annotate(rank=sum(
+        (
+            Case(
+                When(name__icontains=word, then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+            for word in words
+        ),
+        Value(0)
+    )).order_by('-rank', '-pub_date')
+
+
+def search_ingredients_fuzzy(text, limit=FUZZY_SEARCH_LIMIT):
+    """Ингредиенты, похожие на text по триграммам, лучшие первыми.
+
+    На PostgreSQL используется оператор % из pg_trgm и GIN-индекс,
+    иначе — триграммный индекс в памяти процесса.
+    """
+    if not is_postgresql():
+        from .indexes import ingredient_trigram_index
+        return ingredient_trigram_index.search(text, limit)
+    return list(Ingredient.objects.filter(
+        name__trigram_similar=text
+    ).annotate(
+        similarity=TrigramSimilarity('name', text)
+    ).order_by('-similarity', 'name').values(
+        'id', 'name', 'measurement_unit'
+    )[:limit])
+
+
+class RecipeSearchFilter(filters.SearchFilter):
+    """Поиск рецептов по параметру search."""
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search_recipes(queryset, text)
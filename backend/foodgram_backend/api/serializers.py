@@ -1,39 +1,34 @@
 from django.contrib.auth import get_user_model
-from django.db.utils import IntegrityError
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers, validators
 
+from .cache import get_cached_representation
+from .constants import MIN_VALUE
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
                      ShoppingCart, Tag)
+from .search import update_search_vectors
+from .tasks import make_recipe_thumbnails
+from .utils import (get_amounts_delta, lock_recipes, update_shopping_lists,
+                    update_tags_masks)
+from .viewer import get_viewer_state
 from users.serializers import Base64ImageField, CustomUserSerializer
 
 User = get_user_model()
 
 
 class IngredientAmountSerializer(serializers.ModelSerializer):
-    id = serializers.IntegerField(read_only=False)
-    name = serializers.CharField(required=False)
-    measurement_unit = serializers.CharField(required=False)
-    amount = serializers.SerializerMethodField()
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name', read_only=True)
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit', read_only=True
+    )
+    amount = serializers.IntegerField()
 
     class Meta:
-        model = Ingredient
+        model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
-    def get_amount(self, obj):
-        request = self.context['request']
-        if request.method == 'GET':
-            recipe = Recipe.objects.get(id=self.context.get('recipe_id'))
-        else:
-            recipe = Recipe.objects.get(
-                name=self.context['request'].data.get('name')
-            )
-        amount = RecipeIngredient.objects.get(
-            recipe=recipe, ingredient=obj
-        ).amount
-        if amount < 1:
-            raise serializers.ValidationError('Amount should be >= 1!')
-        return amount
-
 
 class IngredientSerializer(serializers.ModelSerializer):
 
@@ -55,153 +50,194 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'slug')
 
 
+class ThumbnailsField(serializers.Field):
+    """Ссылки на миниатюры: {размер: {'webp': url, 'fallback': url}}."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, thumbnails):
+        request = self.context.get('request')
+        urls = {}
+        for size, files in thumbnails.items():
+            urls[size] = {}
+            for kind, name in files.items():
+                url = default_storage.url(name)
+                urls[size][kind] = (
+                    request.build_absolute_uri(url) if request else url
+                )
+        return urls
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False, read_only=True)
-    ingredients = IngredientAmountSerializer(many=True)
+    ingredients = IngredientAmountSerializer(
+        many=True, source='recipe_for_ingredients'
+    )
     tags = TagSerializer(many=True)
     author = CustomUserSerializer(default=serializers.CurrentUserDefault())
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(allow_null=True, required=False)
+    thumbnails = ThumbnailsField()
     cooking_time = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'ingredients', 'tags', 'author', 'is_favorited',
-            'is_in_shopping_cart', 'image', 'name', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'image', 'thumbnails', 'name', 'text',
+            'cooking_time'
         )
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(
-                user=request.user, favorite=obj
-            ).exists()
-        else:
-            return False
+        return obj.id in get_viewer_state(self.context).favorited_ids
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return ShoppingCart.objects.filter(
-                user=request.user, recipe=obj
-            ).exists()
-        else:
-            return False
+        return obj.id in get_viewer_state(self.context).in_cart_ids
 
     def to_internal_value(self, data):
         data['tags'] = [{'id': tag} for tag in data['tags']]
         return super().to_internal_value(data)
 
     def to_representation(self, instance):
-        self.context['recipe_id'] = instance.id
-        return super().to_representation(instance)
-
-    def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        for ingredient in ingredients:
-            if int(ingredient['amount']) < 1:
-                raise serializers.ValidationError(
-                    'Cannot use ingr with amount < 1!'
-                )
+        """Общий для всех кэшированный документ и флаги зрителя поверх."""
+        data = get_cached_representation(
+            self.context.get('request'), instance,
+            lambda: super(RecipeSerializer, self).to_representation(instance)
+        )
+        viewer = get_viewer_state(self.context)
+        data['is_favorited'] = instance.id in viewer.favorited_ids
+        data['is_in_shopping_cart'] = instance.id in viewer.in_cart_ids
+        data['author']['is_subscribed'] = (
+            data['author']['id'] in viewer.subscribed_ids
+        )
         return data
 
-    def create(self, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        ingredients = self.initial_data.get('ingredients')
+    def validate(self, data):
+        ingredients = data.get('recipe_for_ingredients')
         if not ingredients:
             raise serializers.ValidationError(
                 'Recipe MUST contain at least one ingredient!'
             )
+        if any(ingredient['amount'] < MIN_VALUE for ingredient in ingredients):
+            raise serializers.ValidationError(
+                'Cannot use ingr with amount < 1!'
+            )
+        ingredient_ids = {
+            ingredient['ingredient']['id'] for ingredient in ingredients
+        }
+        if len(ingredient_ids) != len(ingredients):
+            raise serializers.ValidationError(
+                'You cannot use one ingredient twice!'
+            )
+        if Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).count() != len(ingredient_ids):
+            raise serializers.ValidationError('There is no such ingredient!')
+        tags = data.get('tags', [])
+        tag_ids = {tag['id'] for tag in tags}
+        if len(tag_ids) != len(tags):
+            raise serializers.ValidationError(
+                'You cannot use this tag twice!'
+            )
+        if Tag.objects.filter(id__in=tag_ids).count() != len(tag_ids):
+            raise serializers.ValidationError('Tag does not exist')
+        return data
+
+    def set_ingredients(self, recipe, ingredients):
+        amounts = {
+            ingredient['ingredient']['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe
+            )
+        }
+        RecipeIngredient.objects.filter(
+            recipe=recipe, ingredient_id__in=current.keys() - amounts.keys()
+        ).delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        update_search_vectors([recipe.id])
+        return old_amounts, amounts
+
+    def set_tags(self, recipe, tags):
+        tag_ids = {tag['id'] for tag in tags}
+        current = set(RecipeTag.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', flat=True))
+        RecipeTag.objects.filter(
+            recipe=recipe, tag_id__in=current - tag_ids
+        ).delete()
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag_id=tag_id)
+            for tag_id in tag_ids - current
+        )
+        update_tags_masks([recipe.id])
+
+    @transaction.atomic
+    def create(self, validated_data):
+        ingredients = validated_data.pop('recipe_for_ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        for ingredient in ingredients:
-            try:
-                current_ingredient = Ingredient.objects.get(
-                    id=ingredient.get('id')
-                )
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError(
-                    'There is no such ingredient!'
-                )
-            try:
-                RecipeIngredient.objects.create(
-                    recipe_id=recipe.id, ingredient_id=current_ingredient.id,
-                    amount=ingredient.get('amount')
-                )
-            except IntegrityError:
-                raise serializers.ValidationError(
-                    'You cannot use one ingredient twice!'
-                )
-        for tag in tags:
-            try:
-                current_tag = Tag.objects.get(id=tag.get('id'))
-            except Tag.DoesNotExist:
-                raise serializers.ValidationError('Tag does not exist')
-            try:
-                RecipeTag.objects.create(
-                    recipe=recipe, tag_id=current_tag.id
-                )
-            except IntegrityError:
-                raise serializers.ValidationError(
-                    'You cannot use this tag twice!'
-                )
+        self.set_ingredients(recipe, ingredients)
+        self.set_tags(recipe, tags)
+        make_recipe_thumbnails.delay(recipe_id=recipe.pk)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        lock_recipes([instance.pk])
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time
         )
         instance.image = validated_data.get('image', instance.image)
-        ingredients = validated_data.pop('ingredients')
+        ingredients = validated_data.pop('recipe_for_ingredients')
         tags = validated_data.pop('tags')
         instance.save()
-        to_del = RecipeIngredient.objects.filter(recipe=instance.id)
-        to_del.delete()
-        to_del = RecipeTag.objects.filter(recipe=instance.id)
-        to_del.delete()
-        ingredients = self.initial_data.get('ingredients')
-        for ingredient in ingredients:
-            try:
-                current_ingredient = Ingredient.objects.get(
-                    id=ingredient.get('id')
-                )
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError('No such ingredient')
-            try:
-                RecipeIngredient.objects.create(
-                    recipe_id=instance.id,
-                    ingredient_id=current_ingredient.id,
-                    amount=ingredient.get('amount')
-                )
-            except IntegrityError:
-                raise serializers.ValidationError(
-                    'You cannot use one ingredient twice!'
-                )
-        for tag in tags:
-            try:
-                current_tag = Tag.objects.get(id=tag['id'])
-            except Tag.DoesNotExist:
-                raise serializers.ValidationError('No such Tag!')
-            try:
-                RecipeTag.objects.create(
-                    recipe=instance, tag_id=current_tag.id
-                )
-            except IntegrityError:
-                raise serializers.ValidationError(
-                    'You cannot use this tag twice!'
-                )
+        old_amounts, new_amounts = self.set_ingredients(
+            instance, ingredients
+        )
+        self.set_tags(instance, tags)
+        if 'image' in validated_data:
+            make_recipe_thumbnails.delay(recipe_id=instance.pk)
+        update_shopping_lists(
+            list(ShoppingCart.objects.filter(
+                recipe=instance
+            ).values_list('user_id', flat=True)),
+            get_amounts_delta(old_amounts, new_amounts)
+        )
         return instance
 
 
 class RecipeIsFavoriteSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -0,0 +1,139 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, F, Value, When
+from django.urls import reverse
+from django.utils import timezone
+from shortener import shortener
+from shortener.models import UrlMap
+
+from .constants import SHORT_LINK_CACHE_SIZE, SHORT_LINK_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Алфавит django-link-shortener без l, I и 1: случайные коды библиотеки
+# не содержат единицу, поэтому коды рецептов с префиксом 1 с ними не
+# пересекаются.
+ALPHABET = 'ABCDEFGHJKLMNOPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz234567890'
+RECIPE_CODE_PREFIX = '1'
+NEVER_EXPIRES = timezone.make_aware(
+    timezone.datetime.max, timezone.get_default_timezone()
+)
+
+
+def get_recipe_code(recipe_id):
+    """Детерминированный короткий код рецепта, не зависящий от хоста."""
+    digits = []
+    while True:
+        recipe_id, remainder = divmod(recipe_id, len(ALPHABET))
+        digits.append(ALPHABET[remainder])
+        if not recipe_id:
+            break
+    return RECIPE_CODE_PREFIX + ''.join(reversed(digits))
+
+
+class ShortLinkCache:
+    """LRU кодов коротких ссылок и счётчик переходов в памяти процесса.
+
+    Переходы копятся в памяти и записываются одним UPDATE фоновым
+    потоком раз в SHORT_LINK_FLUSH_INTERVAL секунд и при выходе.
+    """
+
+    def __init__(self, size=SHORT_LINK_CACHE_SIZE,
+                 flush_interval=SHORT_LINK_FLUSH_INTERVAL):
+        self.size = size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.links = OrderedDict()
+        self.hits = Counter()
+        self.flusher = None
+
+    def remember(self, code, full_url, date_expired=NEVER_EXPIRES):
+        with self.lock:
+            self.links[code] = (full_url, date_expired)
+            self.links.move_to_end(code)
+            if len(self.links) > self.size:
+                self.links.popitem(last=False)
+
+    def forget(self, code):
+        with self.lock:
+            self.links.pop(code, None)
+
+    def get(self, code):
+        with self.lock:
+            link = self.links.get(code)
+            if link is not None:
+                self.links.move_to_end(code)
+            return link
+
+    def create_recipe_link(self, recipe):
+        """Код рецепта; строка UrlMap создаётся одним INSERT без конфликта."""
+        code = get_recipe_code(recipe.id)
+        if self.get(code) is None:
+            full_url = reverse('recipes-detail', args=(recipe.id,))
+            UrlMap.objects.bulk_create([UrlMap(
+                user_id=recipe.author_id, full_url=full_url, short_url=code,
+                date_expired=NEVER_EXPIRES
+            )], ignore_conflicts=True)
+            self.remember(code, full_url)
+        return code
+
+    def expand(self, code):
+        """Адрес по коду; KeyError и PermissionError как в shortener."""
+        link = self.get(code)
+        if link is None:
+            row = UrlMap.objects.filter(short_url=code).values(
+                'full_url', 'date_expired', 'max_count'
+            ).first()
+            if row is None:
+                raise KeyError('invalid shortlink')
+            if row['max_count'] != -1:
+                return shortener.expand(code)
+            link = (row['full_url'], row['date_expired'])
+            self.remember(code, *link)
+        full_url, date_expired = link
+        if timezone.now() > date_expired:
+            raise PermissionError('shortlink expired')
+        self.hit(code)
+        return full_url
+
+    def hit(self, code):
+        with self.lock:
+            self.hits[code] += 1
+            if self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self.run_flusher, daemon=True
+                )
+                self.flusher.start()
+
+    def run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            hits, self.hits = self.hits, Counter()
+        if not hits:
+            return
+        try:
+            UrlMap.objects.filter(short_url__in=hits).update(
+                usage_count=F('usage_count') + Case(
+                    *(When(short_url=code, then=Value(count))
+                      for code, count in hits.items()),
+                    default=Value(0)
+                )
+            )
+        except DatabaseError:
+            logger.exception('Не удалось записать переходы по ссылкам')
+            with self.lock:
+                self.hits.update(hits)
+
+
+short_link_cache = ShortLinkCache()
+atexit.register(short_link_cache.flush)
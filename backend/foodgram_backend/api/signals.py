@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from shortener.models import UrlMap
+
+from .cache import bump_recipes_version
+from .indexes import ingredient_index, ingredient_trigram_index
+from .models import Ingredient, Recipe, RecipeTag, ShoppingCart, Tag, User
+from .shortlinks import get_recipe_code, short_link_cache
+from .slow_queries import install_slow_query_logger
+from .snapshots import ingredient_snapshot, tag_snapshot
+from .tasks import update_ingredient_search
+from .utils import (get_recipe_amounts, lock_recipes, update_shopping_lists,
+                    update_tags_masks)
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+    transaction.on_commit(ingredient_trigram_index.invalidate)
+    transaction.on_commit(ingredient_snapshot.invalidate)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search(instance, created, **kwargs):
+    if not created:
+        update_ingredient_search.delay(ingredient_id=instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_snapshot(**kwargs):
+    transaction.on_commit(tag_snapshot.invalidate)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(instance, **kwargs):
+    """Вычитает рецепт из списка покупок при любом удалении из корзины.
+
+    Срабатывает и при каскадном удалении рецепта или его автора.
+    """
+    lock_recipes([instance.recipe_id])
+    update_shopping_lists([instance.user_id], {
+        ingredient_id: -amount for ingredient_id, amount
+        in get_recipe_amounts(instance.recipe_id).items()
+    })
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_recipes(instance, **kwargs):
+    instance.recipe_ids = list(RecipeTag.objects.filter(
+        tag=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def clear_tag_bit(instance, **kwargs):
+    """Снимает бит удалённого тега: его получит следующий новый тег."""
+    update_tags_masks(getattr(instance, 'recipe_ids', []))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_recipe_responses(**kwargs):
+    transaction.on_commit(bump_recipes_version)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, update_fields, **kwargs):
+    """Меняет ключи кэша рецептов при правке профиля их автора.
+
+    Сохранения, не задевающие показываемые поля (например, last_login
+    при входе), рецепты не трогают.
+    """
+    if created or update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    if Recipe.objects.filter(author=instance).update(
+        updated_at=timezone.now()
+    ):
+        transaction.on_commit(bump_recipes_version)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_short_link(instance, **kwargs):
+    code = get_recipe_code(instance.pk)
+    UrlMap.objects.filter(short_url=code).delete()
+    transaction.on_commit(lambda: short_link_cache.forget(code))
+
+
+connection_created.connect(install_slow_query_logger)
@@ -0,0 +1,100 @@
+import logging
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+current_view = ContextVar('current_view', default=None)
+
+LOCKING_CLAUSE = re.compile(
+    r'\bFOR\s+(?:UPDATE|NO\s+KEY\s+UPDATE|SHARE|KEY\s+SHARE)\b'
+)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+class SlowQueryLogger:
+    """Execute-обёртка, логирующая запросы дольше SLOW_QUERY_THRESHOLD.
+
+    Для PostgreSQL доля SLOW_QUERY_EXPLAIN_SAMPLE_RATE медленных SELECT
+    дополняется планом EXPLAIN (ANALYZE, BUFFERS), но не чаще раза в
+    SLOW_QUERY_EXPLAIN_INTERVAL секунд на процесс. ANALYZE выполняет
+    запрос повторно, поэтому планы снимаются только вне транзакций и
+    для SELECT без блокировок строк.
+
+    Параметры запросов могут содержать токены и почту, поэтому они
+    попадают в журнал только при SLOW_QUERY_LOG_PARAMS, а строковые
+    литералы в планах без него заменяются на '?'.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.explained_at = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if (settings.SLOW_QUERY_THRESHOLD
+                    and duration >= settings.SLOW_QUERY_THRESHOLD):
+                self.report(sql, params, many, context, duration)
+
+    def report(self, sql, params, many, context, duration):
+        view = current_view.get() or '-'
+        if settings.SLOW_QUERY_LOG_PARAMS:
+            logger.warning(
+                'Медленный запрос %.1f мс в %s: %s; параметры: %r',
+                duration * 1000, view, sql, params
+            )
+        else:
+            logger.warning(
+                'Медленный запрос %.1f мс в %s: %s',
+                duration * 1000, view, sql
+            )
+        connection = context['connection']
+        if not many and self.can_explain(sql, connection):
+            self.explain(sql, params, connection, view)
+
+    def can_explain(self, sql, connection):
+        statement = sql.lstrip().upper()
+        if (connection.vendor != 'postgresql'
+                or connection.in_atomic_block
+                or not statement.startswith('SELECT')
+                or LOCKING_CLAUSE.search(statement)
+                or random.random() >= settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE):
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if (self.explained_at is not None
+                    and now - self.explained_at
+                    < settings.SLOW_QUERY_EXPLAIN_INTERVAL):
+                return False
+            self.explained_at = now
+        return True
+
+    def explain(self, sql, params, connection, view):
+        try:
+            with connection.connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception:
+            logger.exception('Не удалось получить план запроса')
+            return
+        if not settings.SLOW_QUERY_LOG_PARAMS:
+            plan = STRING_LITERAL.sub("'?'", plan)
+        logger.warning('План медленного запроса в %s:\n%s', view, plan)
+
+
+slow_query_logger = SlowQueryLogger()
+
+
+def install_slow_query_logger(connection, **kwargs):
+    """Подключает обёртку к каждому новому соединению с БД."""
+    if slow_query_logger not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_logger)
@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from .constants import CATALOG_SNAPSHOT_TTL
+from .models import Ingredient, Tag
+from .serializers import IngredientSerializer, TagSerializer
+
+
+class InMemorySnapshot:
+    """Данные каталога, собранные из БД и хранимые в памяти процесса.
+
+    Снимок строится при первом обращении и сбрасывается сигналами при
+    изменении моделей каталога. Другие процессы gunicorn узнают об
+    изменениях не позже чем через ttl секунд.
+    """
+
+    def __init__(self, ttl=CATALOG_SNAPSHOT_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is None or time.monotonic() - snapshot[0] > self.ttl:
+            with self.lock:
+                if self.snapshot is snapshot:
+                    self.snapshot = (time.monotonic(), self.build())
+                snapshot = self.snapshot
+        return snapshot[1]
+
+    def invalidate(self):
+        with self.lock:
+            self.snapshot = None
+
+
+def accepts_gzip(accept_encoding):
+    """Принимает ли клиент gzip с учётом q-значений Accept-Encoding."""
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    quality = qualities.get('gzip', qualities.get('*', 0.0))
+    return quality > 0
+
+
+class ResponseSnapshot(InMemorySnapshot):
+    """Готовый JSON-ответ списка с ETag, Last-Modified и gzip-копией.
+
+    У gzip-копии свой ETag с суффиксом -gzip. Last-Modified версии
+    снимка хранится в общем кэше по её хешу, поэтому все процессы
+    отдают одну дату для одного содержимого.
+    """
+
+    def __init__(self, queryset, serializer_class, **kwargs):
+        super().__init__(**kwargs)
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+
+    def build(self):
+        content = JSONRenderer().render(
+            self.serializer_class(self.queryset.all(), many=True).data
+        )
+        version = hashlib.sha256(content).hexdigest()[:32]
+        return {
+            'identity': (content, f'"{version}"'),
+            'gzip': (gzip.compress(content), f'"{version}-gzip"'),
+            'last_modified': cache.get_or_set(
+                f'snapshot-modified:{version}', lambda: int(time.time()), None
+            )
+        }
+
+    def serve(self, request):
+        snapshot = self.get()
+        gzipped = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        content, etag = snapshot['gzip' if gzipped else 'identity']
+        response = get_conditional_response(
+            request, etag=etag, last_modified=snapshot['last_modified']
+        )
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(snapshot['last_modified'])
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+ingredient_snapshot = ResponseSnapshot(
+    Ingredient.objects.all(), IngredientSerializer
+)
+tag_snapshot = ResponseSnapshot(Tag.objects.all(), TagSerializer)
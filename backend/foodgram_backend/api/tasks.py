@@ -0,0 +1,116 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump_recipes_version
+from .constants import (TASK_BATCH_SIZE, TASK_MAX_ATTEMPTS, TASK_RETRY_DELAY,
+                        TASK_VISIBILITY_TIMEOUT)
+from .images import make_thumbnails
+from .models import Recipe, Task
+from .search import update_search_vectors
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(func):
+    """Регистрирует функцию как задачу очереди.
+
+    func.delay(**kwargs) ставит её в очередь; аргументы должны
+    сериализоваться в JSON.
+    """
+    name = f'{func.__module__}.{func.__name__}'
+    registry[name] = func
+    func.delay = lambda **kwargs: enqueue(name, **kwargs)
+    return func
+
+
+def enqueue(name, **kwargs):
+    """Ставит задачу в очередь в текущей транзакции.
+
+    Воркер увидит задачу только после фиксации транзакции, а при откате
+    она исчезнет вместе с данными. При TASKS_EAGER задача выполняется
+    в процессе после фиксации.
+    """
+    if settings.TASKS_EAGER:
+        transaction.on_commit(lambda: registry[name](**kwargs))
+        return
+    Task.objects.create(name=name, kwargs=kwargs)
+
+
+def claim_tasks(limit=TASK_BATCH_SIZE,
+                visibility_timeout=TASK_VISIBILITY_TIMEOUT):
+    """Забирает до limit готовых задач, скрывая их от других воркеров.
+
+    Задача захватывается условным UPDATE по прежнему available_at, так
+    что конкурирующий воркер получит 0 строк. Если воркер упадёт, задача
+    снова станет доступна через visibility_timeout секунд.
+    """
+    now = timezone.now()
+    hidden_until = now + timedelta(seconds=visibility_timeout)
+    candidates = list(Task.objects.filter(
+        failed=False, available_at__lte=now
+    ).values_list('pk', 'available_at')[:limit])
+    claimed = [
+        pk for pk, available_at in candidates
+        if Task.objects.filter(pk=pk, available_at=available_at).update(
+            available_at=hidden_until, attempts=F('attempts') + 1
+        )
+    ]
+    return list(Task.objects.filter(pk__in=claimed))
+
+
+def run_task(queued):
+    """Выполняет задачу; при ошибке откладывает её с backoff."""
+    try:
+        func = registry.get(queued.name)
+        if func is None:
+            raise LookupError(f'Неизвестная задача {queued.name}')
+        with transaction.atomic():
+            func(**queued.kwargs)
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', queued)
+        failed = queued.attempts >= TASK_MAX_ATTEMPTS
+        delay = TASK_RETRY_DELAY * 2 ** (queued.attempts - 1)
+        Task.objects.filter(pk=queued.pk).update(
+            failed=failed,
+            last_error=traceback.format_exc(),
+            available_at=timezone.now() + timedelta(seconds=delay)
+        )
+        return False
+    Task.objects.filter(pk=queued.pk).delete()
+    return True
+
+
+@task
+def make_recipe_thumbnails(recipe_id):
+    """Миниатюры рецепта; новая отметка updated_at сбросит его документ.
+
+    Смена версии рецептов нужна только страницам анонимного кэша и
+    доходит до веб-процессов лишь через общий кэш. С LocMem она
+    меняет кэш самого воркера, а страницы устаревают до конца
+    RECIPE_CACHE_TTL.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None:
+        return
+    thumbnails = make_thumbnails(recipe.image) if recipe.image else {}
+    Recipe.objects.filter(pk=recipe_id).update(
+        thumbnails=thumbnails, updated_at=timezone.now()
+    )
+    transaction.on_commit(bump_recipes_version)
+
+
+@task
+def update_ingredient_search(ingredient_id):
+    recipes = Recipe.objects.filter(
+        recipe_for_ingredients__ingredient=ingredient_id
+    ).values('pk')
+    update_search_vectors(recipes)
+    Recipe.objects.filter(pk__in=recipes).update(updated_at=timezone.now())
@@ -0,0 +1,380 @@
+import io
+import json
+import struct
+import subprocess
+import tempfile
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import call, patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .images import open_image
+from .indexes import ingredient_index
+from .metrics import MetricsStore
+from .middleware import QueryRecorder
+from .models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                     ShoppingCart, ShoppingListItem, Tag)
+from .serializers import TagSerializer
+from .slow_queries import SlowQueryLogger
+from .snapshots import ResponseSnapshot, accepts_gzip, tag_snapshot
+from .tasks import make_recipe_thumbnails
+from .utils import update_tags_masks
+
+User = get_user_model()
+
+
+class RecipeTestCase(APITestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.buyer = User.objects.create(
+            username='buyer', email='buyer@example.com'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        self.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Блины', text='Текст', cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=10
+        )
+        RecipeTag.objects.create(recipe=self.recipe, tag=self.tag)
+
+    def get_total(self):
+        return ShoppingListItem.objects.get(
+            user=self.buyer, ingredient=self.ingredient
+        ).total_amount
+
+
+class ShoppingListTests(RecipeTestCase):
+
+    def test_amount_change_updates_buyers_shopping_list(self):
+        self.client.force_authenticate(self.buyer)
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.assertEqual(self.get_total(), 10)
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {
+                'name': 'Блины',
+                'text': 'Текст',
+                'cooking_time': 10,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 100}],
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_total(), 100)
+
+    def test_cascade_delete_updates_buyers_shopping_list(self):
+        self.client.force_authenticate(self.buyer)
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.author.delete()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.buyer
+        ).exists())
+
+
+class AdminShoppingListTests(RecipeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Recipe.objects.filter(pk=self.recipe.pk).update(image='recipe.png')
+        self.client.force_authenticate(self.buyer)
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.client.force_login(User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        ))
+
+    def get_change_data(self, url):
+        """Данные формы изменения в том виде, в каком её отправит браузер."""
+        response = self.client.get(url)
+        data = {}
+        forms = [response.context['adminform'].form]
+        for formset in response.context['inline_admin_formsets']:
+            management = formset.formset.management_form
+            data.update({
+                management.add_prefix(name): value
+                for name, value in management.initial.items()
+            })
+            forms.extend(formset.formset.forms)
+        for form in forms:
+            for name, field in form.fields.items():
+                value = form.initial.get(name, field.initial)
+                if value is None or name == 'image':
+                    continue
+                if hasattr(value, 'pk'):
+                    value = value.pk
+                data[form.add_prefix(name)] = value
+        return data
+
+    def test_recipe_inline_edit_updates_shopping_lists(self):
+        url = f'/admin/api/recipe/{self.recipe.id}/change/'
+        data = self.get_change_data(url)
+        amount_field = next(
+            name for name in data
+            if name.startswith('recipe_for_ingredients-0-')
+            and name.endswith('-amount')
+        )
+        data[amount_field] = 100
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_total(), 100)
+
+    def test_cart_deleted_in_admin_updates_shopping_list(self):
+        cart = ShoppingCart.objects.get(user=self.buyer)
+        self.client.post(
+            f'/admin/api/shoppingcart/{cart.id}/delete/', {'post': 'yes'}
+        )
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.buyer
+        ).exists())
+
+
+class TagMaskTests(RecipeTestCase):
+
+    def test_deleted_tag_bit_is_not_inherited(self):
+        update_tags_masks([self.recipe.id])
+        self.tag.delete()
+        new_tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.assertEqual(new_tag.bit, self.tag.bit)
+        response = self.client.get('/api/recipes/?tags=lunch')
+        self.assertEqual(response.data['count'], 0)
+
+
+class RecipeCacheTests(RecipeTestCase):
+
+    def test_saved_recipe_changes_cache_key(self):
+        self.client.force_authenticate(self.buyer)
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(self.client.get(url).data['name'], 'Блины')
+        self.recipe.name = 'Оладьи'
+        self.recipe.save()
+        self.assertEqual(self.client.get(url).data['name'], 'Оладьи')
+
+    def test_thumbnails_task_changes_cache_key(self):
+        self.client.force_authenticate(self.buyer)
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(self.client.get(url).data['thumbnails'], {})
+        Recipe.objects.filter(pk=self.recipe.id).update(image='recipe.png')
+        thumbnails = {'small': {'webp': 'recipe-small.webp'}}
+        with patch('api.tasks.make_thumbnails', return_value=thumbnails):
+            make_recipe_thumbnails(recipe_id=self.recipe.id)
+        self.assertIn('small', self.client.get(url).data['thumbnails'])
+
+    def test_author_profile_change_changes_cache_key(self):
+        self.client.force_authenticate(self.buyer)
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.client.get(url)
+        self.author.first_name = 'Иван'
+        self.author.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['author']['first_name'], 'Иван')
+
+    def test_cache_hit_skips_prefetch(self):
+        self.client.force_authenticate(self.buyer)
+        self.client.get('/api/recipes/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.data['results'][0]['name'], 'Блины')
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'api_recipeingredient' in query['sql']
+        ])
+
+
+class ServerTimingTests(RecipeTestCase):
+
+    def test_trace_for_staff(self):
+        self.author.is_staff = True
+        self.author.save()
+        token = Token.objects.create(user=self.author)
+        response = self.client.get(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token.key}',
+            HTTP_X_DEBUG_TIMING='sql'
+        )
+        self.assertIn('Server-Timing', response)
+        self.assertIn('_sql_trace', response.json())
+
+    def test_no_trace_recorded_for_anonymous(self):
+        with patch(
+            'api.middleware.QueryRecorder', wraps=QueryRecorder
+        ) as recorder:
+            response = self.client.get(
+                '/api/recipes/', HTTP_X_DEBUG_TIMING='sql'
+            )
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('_sql_trace', response.json())
+        self.assertNotIn(call(trace=True), recorder.call_args_list)
+
+
+class RecipeCursorPaginationTests(RecipeTestCase):
+
+    def test_search_falls_back_to_page_numbers(self):
+        response = self.client.get('/api/recipes/?cursor=&search=Блины')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('count', response.data)
+
+    def test_page_size_is_capped(self):
+        for number in range(101):
+            Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10
+            )
+        response = self.client.get('/api/recipes/?cursor=&limit=1000')
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertIsNotNone(response.data['next'])
+
+
+class IngredientIndexTests(APITestCase):
+
+    def test_names_differing_only_by_case(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        ingredient_index.invalidate()
+        response = self.client.get('/api/ingredients/?name=сол')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.data],
+            ['Соль', 'соль']
+        )
+
+    def tearDown(self):
+        ingredient_index.invalidate()
+
+
+class ResponseSnapshotTests(APITestCase):
+
+    def setUp(self):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+        tag_snapshot.invalidate()
+        self.addCleanup(tag_snapshot.invalidate)
+
+    def test_gzip_variant_has_its_own_etag(self):
+        identity = self.client.get('/api/tags/')
+        gzipped = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertNotEqual(identity['ETag'], gzipped['ETag'])
+        self.assertEqual(identity['Last-Modified'], gzipped['Last-Modified'])
+        response = self.client.get(
+            '/api/tags/', HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=gzipped['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_accept_encoding_quality_values(self):
+        self.assertTrue(accepts_gzip('gzip, deflate, br'))
+        self.assertTrue(accepts_gzip('br;q=1.0, *;q=0.5'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('gzip;q=0, *'))
+        self.assertFalse(accepts_gzip(''))
+
+    def test_processes_agree_on_last_modified(self):
+        first = ResponseSnapshot(Tag.objects.all(), TagSerializer).get()
+        later = first['last_modified'] + 100
+        with patch('api.snapshots.time.time', return_value=later):
+            second = ResponseSnapshot(Tag.objects.all(), TagSerializer).get()
+        self.assertEqual(first['last_modified'], second['last_modified'])
+
+
+class RunTasksTests(SimpleTestCase):
+
+    def test_worker_survives_database_errors(self):
+        command = 'api.management.commands.run_tasks'
+        with patch(f'{command}.claim_tasks',
+                   side_effect=[OperationalError(), []]) as claim, \
+                patch(f'{command}.close_old_connections') as close, \
+                patch(f'{command}.time.sleep'), \
+                self.assertLogs(command):
+            call_command('run_tasks', once=True, stdout=io.StringIO())
+        self.assertEqual(claim.call_count, 2)
+        self.assertEqual(close.call_count, 2)
+
+
+def make_png_declaring(width, height):
+    """PNG 1x1 с подменёнными в IHDR размерами."""
+    buffer = io.BytesIO()
+    Image.new('L', (1, 1)).save(buffer, 'PNG')
+    data = bytearray(buffer.getvalue())
+    header = b'IHDR' + struct.pack('>II', width, height) + bytes(data[24:29])
+    data[12:29] = header
+    data[29:33] = struct.pack('>I', zlib.crc32(header))
+    return bytes(data)
+
+
+class OpenImageTests(APITestCase):
+
+    def test_oversized_images_are_validation_errors(self):
+        for size in (6000, 10000, 20000):
+            with self.subTest(size=size):
+                with self.assertRaises(serializers.ValidationError):
+                    open_image(make_png_declaring(size, size))
+
+
+@override_settings(
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE=1, SLOW_QUERY_EXPLAIN_INTERVAL=0
+)
+class SlowQueryLoggerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.connection = SimpleNamespace(
+            vendor='postgresql', in_atomic_block=False
+        )
+
+    def test_locking_selects_are_not_explained(self):
+        for clause in ('UPDATE', 'NO KEY UPDATE', 'SHARE', 'KEY SHARE'):
+            with self.subTest(clause=clause):
+                self.assertFalse(SlowQueryLogger().can_explain(
+                    f'SELECT * FROM t WHERE id = %s FOR {clause}',
+                    self.connection
+                ))
+        self.assertTrue(SlowQueryLogger().can_explain(
+            'SELECT * FROM t WHERE id = %s', self.connection
+        ))
+
+    def test_params_are_not_logged_by_default(self):
+        connection = SimpleNamespace(vendor='sqlite')
+        with self.assertLogs('api.slow_queries') as logs:
+            SlowQueryLogger().report(
+                'SELECT * FROM t WHERE key = %s', ('secret-token',), False,
+                {'connection': connection}, 1
+            )
+        self.assertNotIn('secret-token', logs.output[0])
+
+
+class MetricsStoreTests(SimpleTestCase):
+
+    def test_finished_process_files_are_absorbed(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        with tempfile.TemporaryDirectory() as directory:
+            finished = Path(directory) / f'metrics-{process.pid}-1.json'
+            finished.write_text(json.dumps({'name|view|GET': [1, 0, 2, 1]}))
+            with override_settings(METRICS_DIR=directory):
+                store = MetricsStore()
+                self.assertEqual(
+                    store.collect(), {'name|view|GET': [1, 0, 2, 1]}
+                )
+                self.assertFalse(finished.exists())
+                self.assertEqual(
+                    store.collect(), {'name|view|GET': [1, 0, 2, 1]}
+                )
+            self.assertEqual(
+                [path.name for path in Path(directory).iterdir()],
+                [store.path.name]
+            )
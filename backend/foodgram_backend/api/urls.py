@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (FavoriteViewSet, IngredientViewSet, RecipeViewSet,
-                    ShoppingCartViewSet, TagViewSet)
+from .views import (FavoriteViewSet, IngredientViewSet, MetricsView,
+                    RecipeViewSet, ShoppingCartViewSet, TagViewSet)
 
 api_router_v1 = DefaultRouter()
 api_router_v1.register('tags', TagViewSet, basename='tags')
@@ -14,6 +14,7 @@ api_router_v1.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
     path('', include(api_router_v1.urls)),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
     path(
         'recipes/<int:pk>/favorite/', FavoriteViewSet.as_view(
             {
@@ -1,7 +1,15 @@
+import csv
+import json
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 from django_filters import filters, filterset
 from rest_framework import mixins, viewsets
 
-from .models import Ingredient, Recipe, Tag
+from .models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                     ShoppingListItem, Tag)
 
 
 class CreateDestroyViewSet(
@@ -10,6 +18,32 @@ class CreateDestroyViewSet(
     pass
 
 
+def get_tags_mask(tags):
+    mask = 0
+    for tag in tags:
+        mask |= 1 << tag.bit
+    return mask
+
+
+def update_tags_masks(recipe_ids):
+    """Пересчитывает маски тегов и отметку изменения рецептов.
+
+    Вызывается явно после записи тегов: у RecipeTag нет сигналов,
+    чтобы удаление рецепта оставалось быстрым.
+    """
+    now = timezone.now()
+    masks = dict.fromkeys(recipe_ids, 0)
+    for recipe_id, bit in RecipeTag.objects.filter(
+        recipe_id__in=masks
+    ).values_list('recipe_id', 'tag__bit').order_by():
+        masks[recipe_id] |= 1 << bit
+    Recipe.objects.bulk_update(
+        [Recipe(id=recipe_id, tags_mask=mask, updated_at=now)
+         for recipe_id, mask in masks.items()],
+        ('tags_mask', 'updated_at')
+    )
+
+
 class RecipeFilter(filterset.FilterSet):
     author = filters.CharFilter(
         field_name='author__id', lookup_expr='exact'
@@ -17,12 +51,34 @@ class RecipeFilter(filterset.FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_any_tags'
+    )
+    all_tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+        method='filter_all_tags'
     )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags']
+        fields = ['author', 'tags', 'all_tags']
+
+    def filter_any_tags(self, queryset, name, tags):
+        if not tags:
+            return queryset
+        return queryset.alias(
+            matched_tags=F('tags_mask').bitand(get_tags_mask(tags))
+        ).exclude(matched_tags=0)
+
+    def filter_all_tags(self, queryset, name, tags):
+        if not tags:
+            return queryset
+        mask = get_tags_mask(tags)
+        return queryset.alias(
+            matched_tags=F('tags_mask').bitand(mask)
+        ).filter(matched_tags=mask)
 
 
 class IngredientFilter(filterset.FilterSet):
@@ -33,3 +89,133 @@ class IngredientFilter(filterset.FilterSet):
     class Meta:
         model = Ingredient
         fields = ['name']
+
+
+def get_latest_recipes(author_ids, limit, offset=0):
+    """Срез свежих рецептов каждого автора одним запросом.
+
+    Рецепты нумеруются ROW_NUMBER() внутри автора, возвращается словарь
+    author_id -> список рецептов с позициями offset + 1 .. offset + limit.
+    """
+    if not author_ids:
+        return {}
+    ranked = Recipe.objects.filter(author__in=author_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()]
+        )
+    ).order_by().values(
+        'id', 'author_id', 'name', 'image', 'cooking_time', 'position'
+    )
+    sql, params = ranked.query.sql_with_params()
+    recipes = Recipe.objects.raw(
+        'SELECT * FROM (' + sql + ') AS ranked '
+        'WHERE position > %s AND position <= %s '
+        'ORDER BY author_id, position',
+        (*params, offset, offset + limit)
+    )
+    recipes_by_author = {}
+    for recipe in recipes:
+        recipes_by_author.setdefault(recipe.author_id, []).append(recipe)
+    return recipes_by_author
+
+
+def lock_recipes(recipe_ids):
+    """Блокирует строки рецептов до конца транзакции.
+
+    Правки ингредиентов и изменения корзин одного рецепта выполняются
+    по очереди, поэтому покупатели и количества читаются согласованно.
+    """
+    list(Recipe.objects.select_for_update().filter(
+        pk__in=recipe_ids
+    ).order_by('pk').values_list('pk', flat=True))
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def get_amounts_delta(old_amounts, new_amounts):
+    return {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+
+
+def update_shopping_lists(user_ids, amounts):
+    """Прибавляет amounts {ingredient_id: amount} к спискам покупок."""
+    amounts = {
+        ingredient_id: amount
+        for ingredient_id, amount in amounts.items() if amount
+    }
+    if not user_ids or not amounts:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, amount in amounts.items() if amount > 0
+            ],
+            ignore_conflicts=True
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=amounts
+        )
+        items.update(total_amount=F('total_amount') + Case(
+            *(When(ingredient_id=ingredient_id, then=Value(amount))
+              for ingredient_id, amount in amounts.items()),
+            default=Value(0)
+        ))
+        items.filter(total_amount__lte=0).delete()
+
+
+class Echo:
+    """Псевдо-буфер: csv.writer сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(ingredients):
+    for ingredient in ingredients:
+        yield (f'{ingredient["ingredient__name"]} - '
+               f'{ingredient["total_amount"]} '
+               f'{ingredient["ingredient__measurement_unit"]}.\n')
+
+
+def shopping_cart_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['total_amount'],
+            ingredient['ingredient__measurement_unit']
+        ))
+
+
+def shopping_cart_json(ingredients):
+    separator = ''
+    yield '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'amount': ingredient['total_amount'],
+            'measurement_unit': ingredient['ingredient__measurement_unit']
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', shopping_cart_txt),
+    'csv': ('text/csv; charset=utf-8', shopping_cart_csv),
+    'json': ('application/json', shopping_cart_json),
+}
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import cached_property
+
+from .models import Favorite, ShoppingCart
+from users.models import Subscribe
+
+
+class ViewerState:
+    """Подписки, избранное и корзина текущего пользователя.
+
+    Каждое множество загружается одним запросом при первом обращении и
+    живёт до конца запроса, поэтому флаги is_subscribed, is_favorited и
+    is_in_shopping_cart вычисляются проверкой вхождения.
+    """
+
+    def __init__(self, user):
+        self.user_id = user.id if user.is_authenticated else None
+
+    def load(self, queryset, field):
+        if self.user_id is None:
+            return frozenset()
+        return frozenset(
+            queryset.filter(user=self.user_id).values_list(field, flat=True)
+        )
+
+    @cached_property
+    def subscribed_ids(self):
+        return self.load(Subscribe.objects, 'subscribing_id')
+
+    @cached_property
+    def favorited_ids(self):
+        return self.load(Favorite.objects, 'favorite_id')
+
+    @cached_property
+    def in_cart_ids(self):
+        return self.load(ShoppingCart.objects, 'recipe_id')
+
+
+def get_viewer_state(context):
+    """Состояние зрителя, общее для всех сериализаторов запроса."""
+    request = context.get('request')
+    if request is None:
+        return ViewerState(AnonymousUser())
+    state = getattr(request, '_viewer_state', None)
+    if state is None:
+        state = request._viewer_state = ViewerState(request.user)
+    return state
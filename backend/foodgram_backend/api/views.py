@@ -1,25 +1,30 @@
-from django.contrib.auth import get_user_model
-from django.db.models import Prefetch
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
-from django.urls import reverse
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from shortener import shortener
-from shortener.models import UrlMap
+from rest_framework.views import APIView
 
+from .cache import AnonymousResponseCacheMixin, load_recipe_documents
+from .constants import DEFAULT_SHOPPING_CART_FORMAT, SHOPPING_CART_FILENAME
+from .indexes import ingredient_index
+from .metrics import metrics_store
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
-from .pagination import RecipePageNumberPagination
-from .permissions import IsAuthorOrReadOnly
+                     ShoppingCart, ShoppingListItem, Tag)
+from .pagination import RecipeCursorPagination, RecipePageNumberPagination
+from .permissions import IsAuthorOrReadOnly, IsStaffOrMetricsToken
+from .search import RecipeSearchFilter, search_ingredients_fuzzy
 from .serializers import (FavoriteSerializer, IngredientSerializer,
                           RecipeIsFavoriteSerializer, RecipeSerializer,
                           ShoppingCartSerializer, TagSerializer)
-from .utils import CreateDestroyViewSet, IngredientFilter, RecipeFilter
-
-User = get_user_model()
+from .shortlinks import short_link_cache
+from .snapshots import ingredient_snapshot, tag_snapshot
+from .utils import (SHOPPING_CART_FORMATS, CreateDestroyViewSet,
+                    IngredientFilter, RecipeFilter, get_recipe_amounts,
+                    lock_recipes, update_shopping_lists)
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -32,6 +37,17 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     http_method_names = ['get']
 
+    def list(self, request, *args, **kwargs):
+        fuzzy = request.query_params.get('fuzzy')
+        if fuzzy:
+            return Response(search_ingredients_fuzzy(fuzzy))
+        name = request.query_params.get('name')
+        if name is not None and not request.query_params.get('search'):
+            return Response(ingredient_index.search(name))
+        if not request.query_params:
+            return ingredient_snapshot.serve(request)
+        return super().list(request, *args, **kwargs)
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
@@ -40,18 +56,29 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     http_method_names = ['get']
 
+    def list(self, request, *args, **kwargs):
+        return tag_snapshot.serve(request)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthorOrReadOnly]
     pagination_class = RecipePageNumberPagination
     filter_backends = [
-        DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter
+        DjangoFilterBackend, RecipeSearchFilter, filters.OrderingFilter
     ]
     filterset_class = RecipeFilter
-    search_fields = ('^name', 'tags__slug')
     ordering_fields = ('-pub_date',)
 
+    @property
+    def paginator(self):
+        params = self.request.query_params
+        search = params.get(RecipeSearchFilter.search_param, '').strip()
+        if (not hasattr(self, '_paginator') and not search
+                and RecipeCursorPagination.cursor_query_param in params):
+            self._paginator = RecipeCursorPagination()
+        return super().paginator
+
     def get_queryset(self):
         user = self.request.user
         is_in_shopping_cart = self.request.query_params.get(
@@ -60,13 +87,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
         is_favorited = self.request.query_params.get(
             'is_favorited'
         )
-        queryset = Recipe.objects.all()
-        if is_in_shopping_cart and user.is_authenticated:
-            queryset = Recipe.objects.filter(recipe__user=user)
-        if is_favorited and user.is_authenticated:
-            queryset = Recipe.objects.filter(favorite__user=user)
+        queryset = Recipe.objects.select_related('author')
+        if user.is_authenticated:
+            if is_in_shopping_cart:
+                queryset = queryset.filter(Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )))
+            if is_favorited:
+                queryset = queryset.filter(Exists(Favorite.objects.filter(
+                    user=user, favorite=OuterRef('pk')
+                )))
         return queryset
 
+    def load_documents(self, recipes):
+        """Кэшированные документы; связи подгружаются только для промахов."""
+        return load_recipe_documents(self.request, recipes, 'tags', Prefetch(
+            'recipe_for_ingredients',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient'
+            ).order_by('ingredient__name')
+        ))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.load_documents(page)
+        return page
+
+    def get_object(self):
+        return self.load_documents([super().get_object()])[0]
+
     def create(self, request):
         tags = request.data.get('tags', None)
         ingredients = request.data.get('ingredients', None)
@@ -77,7 +127,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save(author=request.user)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        recipe = self.load_documents(
+            [self.get_queryset().get(pk=serializer.instance.pk)]
+        )[0]
+        return Response(
+            self.get_serializer(recipe).data, status=status.HTTP_201_CREATED
+        )
 
     def partial_update(self, request, pk):
         tags = request.data.get('tags')
@@ -92,7 +147,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        recipe = self.load_documents([self.get_queryset().get(pk=pk)])[0]
+        return Response(
+            self.get_serializer(recipe).data, status=status.HTTP_200_OK
+        )
 
     @action(
         methods=['get'], detail=True, url_path='get-link',
@@ -101,53 +159,21 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def get_short_link(self, request, pk):
         """Получение короткой ссылки на рецепт"""
 
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if not recipe:
-            raise ValueError('No recipe to process')
-        protocol_host = request.scheme + '://' + request.META.get(
-            'HTTP_HOST'
-        )
-        origin_path = reverse('recipes-detail', args=(pk,))
-        origin_url = f'{protocol_host}{origin_path}'
-        if UrlMap.objects.filter(full_url=origin_url).exists():
-            existing_link = UrlMap.objects.get(full_url=origin_url)
-            short_link = f'{protocol_host}/s/{existing_link.short_url}'
-            return Response(
-                {'short-link': short_link}, status=status.HTTP_200_OK
-            )
-        if request.user.is_authenticated:
-            link = shortener.create(user=request.user, link=origin_url)
-        else:
-            admin = User.objects.filter(is_staff=True).first()
-            link = shortener.create(user=admin, link=origin_url)
-        short_link = f'{protocol_host}/s/{link}'
+        recipe = get_object_or_404(Recipe.objects.only('author'), pk=pk)
+        code = short_link_cache.create_recipe_link(recipe)
+        short_link = request.build_absolute_uri(f'/s/{code}/')
         return Response(
             {'short-link': short_link}, status=status.HTTP_200_OK
         )
 
-    def generate_recipe_file(self, recipes_to_cart):
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename=shopcart.txt'
-        temp = []
-        for recipe in recipes_to_cart:
-            ingredient_set = RecipeIngredient.objects.filter(recipe=recipe)
-            for recipe_ingredient in ingredient_set:
-                flag = False
-                for c in temp:
-                    if c[0] == recipe_ingredient.ingredient.name:
-                        c[1] += recipe_ingredient.amount
-                        flag = True
-                if not flag:
-                    current_ingr = [
-                        recipe_ingredient.ingredient.name,
-                        recipe_ingredient.amount,
-                        recipe_ingredient.ingredient.measurement_unit
-                    ]
-                    temp.append(current_ingr)
-        lines = []
-        for t in temp:
-            lines.append(f'{t[0]} - {t[1]} {t[2]}.\n')
-        response.writelines(lines)
+    def generate_recipe_file(self, ingredients, file_format):
+        content_type, generate_lines = SHOPPING_CART_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            generate_lines(ingredients), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={SHOPPING_CART_FILENAME}.{file_format}'
+        )
         return response
 
     @action(
@@ -155,12 +181,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated]
     )
     def get_shopping_cart(self, request):
-        user = request.user
-        queryset = ShoppingCart.objects.filter(user=user).prefetch_related(
-            Prefetch('recipe', to_attr='recipe_to_cart')
+        file_format = request.query_params.get(
+            'file_format', DEFAULT_SHOPPING_CART_FORMAT
         )
-        recipes_to_cart = [obj.recipe_to_cart for obj in queryset]
-        return self.generate_recipe_file(recipes_to_cart)
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                f'Формат {file_format} не поддерживается',
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit', 'total_amount'
+        ).order_by('ingredient__name')
+        return self.generate_recipe_file(ingredients.iterator(), file_format)
 
 
 class FavoriteViewSet(CreateDestroyViewSet):
@@ -204,7 +238,12 @@ class ShoppingCartViewSet(CreateDestroyViewSet):
         }
         serializer = ShoppingCartSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_recipes([recipe.id])
+            serializer.save()
+            update_shopping_lists(
+                [request.user.id], get_recipe_amounts(recipe.id)
+            )
         recipe_serializer = RecipeIsFavoriteSerializer(recipe)
         return Response(
             recipe_serializer.data, status=status.HTTP_201_CREATED
@@ -221,3 +260,23 @@ class ShoppingCartViewSet(CreateDestroyViewSet):
             return Response(status=status.HTTP_400_BAD_REQUEST)
         recipe_to_buy.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def expand_short_link(request, code):
+    """Редирект по короткой ссылке; при прогретом кэше без запросов к БД."""
+    try:
+        return redirect(short_link_cache.expand(code))
+    except (KeyError, PermissionError):
+        raise Http404
+
+
+class MetricsView(APIView):
+    """Гистограммы запросов всех процессов в формате Prometheus."""
+
+    permission_classes = [IsStaffOrMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(
+            metrics_store.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
     'rest_framework',
@@ -41,6 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.QueryContextMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -86,6 +92,49 @@ DATABASES = {
     }
 }
 
+# Локальный кэш (по умолчанию) живёт в памяти одного процесса: версия
+# рецептов и кэш анонимных страниц сбрасываются только в процессе,
+# где прошла правка, а остальные отдают старые страницы до истечения
+# RECIPE_CACHE_TTL. Документы рецептов остаются свежими везде: их ключ
+# содержит updated_at. Кэш токенов с локальным кэшем отключён. В
+# docker-compose бэкенд и воркер используют общий memcached.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Каталог метрик процессов одного развёртывания (хоста или контейнера).
+# Его нужно очищать при запуске: номера процессов из старых файлов могут
+# достаться новым процессам. По умолчанию это /tmp контейнера.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_THRESHOLD = float(os.getenv('PROFILE_SLOW_THRESHOLD', 0))
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-profiles')
+)
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 200))
+
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.2))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(
+    os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1)
+)
+SLOW_QUERY_EXPLAIN_INTERVAL = float(
+    os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', 60)
+)
+SLOW_QUERY_LOG_PARAMS = (
+    os.getenv('SLOW_QUERY_LOG_PARAMS', 'false').lower() == 'true'
+)
+
+TASKS_EAGER = os.getenv('TASKS_EAGER', 'false').lower() == 'true'
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -137,7 +186,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.LimitOffsetPagination',
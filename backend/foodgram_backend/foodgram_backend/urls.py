@@ -3,11 +3,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from api.views import expand_short_link
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('users.urls')),
     path('api/', include('api.urls')),
-    path('s/', include('shortener.urls'))
+    path('s/<str:code>/', expand_short_link)
 ]
 
 if settings.DEBUG:
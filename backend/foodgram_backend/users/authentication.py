@@ -0,0 +1,63 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.fields.files import FieldFile
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import User
+from api.cache import is_shared_cache
+from api.constants import AUTH_TOKEN_CACHE_TTL
+
+
+def get_token_cache_key(key):
+    return f'auth-token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def invalidate_token(key):
+    cache.delete(get_token_cache_key(key))
+
+
+def get_user_data(user):
+    """Поля пользователя для кэша в порядке модели, без пароля."""
+    data = {}
+    for field in User._meta.concrete_fields:
+        if field.attname == 'password':
+            continue
+        value = getattr(user, field.attname)
+        data[field.attname] = (
+            value.name if isinstance(value, FieldFile) else value
+        )
+    return data
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем token -> данные пользователя.
+
+    На чтениях пользователь собирается из общего кэша Django без
+    запросов к БД; пишущие запросы всегда читают его из БД, поэтому
+    объект из кэша не сохраняется. Запись удаляется сигналами при
+    выходе, смене пароля, деактивации и удалении пользователя. С кэшем
+    в памяти процесса удаление не дошло бы до других воркеров, поэтому
+    тогда используется обычная TokenAuthentication.
+    """
+
+    def authenticate(self, request):
+        self.use_cache = (
+            request.method in SAFE_METHODS and is_shared_cache()
+        )
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        if not getattr(self, 'use_cache', False):
+            return super().authenticate_credentials(key)
+        cache_key = get_token_cache_key(key)
+        data = cache.get(cache_key)
+        if data is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, get_user_data(user), AUTH_TOKEN_CACHE_TTL)
+            return user, token
+        user = User.from_db(DEFAULT_DB_ALIAS, list(data), list(data.values()))
+        return user, Token(key=key, user=user)
@@ -1,20 +1,19 @@
-import base64
-
-from django.core.files.base import ContentFile
 from djoser.serializers import UserSerializer
 from rest_framework import serializers, validators
 
 from .models import Subscribe, User
+from api.images import clean_image, decode_base64_image
 from api.models import Recipe
 from api.pagination import RecipeLimitOffset
+from api.utils import get_latest_recipes
+from api.viewer import get_viewer_state
 
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            imgstr = data.partition(';base64,')[2]
+            data = clean_image(decode_base64_image(imgstr))
         return super().to_internal_value(data)
 
 
@@ -60,14 +59,7 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        subscribing = User.objects.get(username=obj.username)
-        if request and request.user.is_authenticated:
-            return Subscribe.objects.filter(
-                user=request.user.id, subscribing=subscribing
-            ).exists()
-        else:
-            return False
+        return obj.id in get_viewer_state(self.context).subscribed_ids
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -113,25 +105,23 @@ class ExtendedSubscribeUser(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        subscribing = User.objects.get(username=obj.username)
-        if request and request.user.is_authenticated:
-            return Subscribe.objects.filter(
-                user=request.user.id, subscribing=subscribing
-            ).exists()
-        else:
-            return False
+        return obj.id in get_viewer_state(self.context).subscribed_ids
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        queryset = Recipe.objects.filter(author=obj)
-        paginator = RecipeLimitOffset()
-        page = paginator.paginate_queryset(queryset, request)
-        if page is not None:
-            serializer = RecipeMinified(page, many=True)
-        else:
-            serializer = RecipeMinified(queryset, many=True)
-        return serializer.data
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is None:
+            request = self.context.get('request')
+            paginator = RecipeLimitOffset()
+            recipes_by_author = get_latest_recipes(
+                [obj.id],
+                paginator.get_limit(request),
+                paginator.get_offset(request)
+            )
+        return RecipeMinified(
+            recipes_by_author.get(obj.id, []), many=True
+        ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj).count()
@@ -1,3 +1,4 @@
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
@@ -7,7 +8,8 @@ from rest_framework.response import Response
 from .models import Subscribe, User
 from .serializers import (CreateUserSerializer, CustomUserSerializer,
                           ExtendedSubscribeUser, SubscribeSerializer)
-from api.utils import CreateDestroyViewSet
+from api.pagination import RecipeLimitOffset
+from api.utils import CreateDestroyViewSet, get_latest_recipes
 
 
 class SubscribeViewSet(CreateDestroyViewSet):
@@ -126,19 +128,23 @@ class CustomUserViewSet(viewsets.ModelViewSet):
     def get_subscriptions_list(self, request, *args, **kwargs):
         user = request.user
         paginator = self.pagination_class()
-        queryset = User.objects.filter(Subscribing__user=user)
-        if not queryset:
-            raise ValueError(
-                'Текущий пользователь ни на кого не подписан!'
-            )
+        queryset = User.objects.filter(Subscribing__user=user).annotate(
+            recipes_count=Count('recipes')
+        )
         page = paginator.paginate_queryset(queryset, request)
-        if page is not None:
-            serializer = ExtendedSubscribeUser(
-                page, many=True, context={'request': request}
+        authors = queryset if page is None else page
+        recipe_paginator = RecipeLimitOffset()
+        context = {
+            'request': request,
+            'recipes_by_author': get_latest_recipes(
+                [author.id for author in authors],
+                recipe_paginator.get_limit(request),
+                recipe_paginator.get_offset(request)
             )
+        }
+        serializer = ExtendedSubscribeUser(
+            authors, many=True, context=context
+        )
+        if page is not None:
             return paginator.get_paginated_response(serializer.data)
-        else:
-            serializer = ExtendedSubscribeUser(
-                queryset, many=True, context={'request': request}
-            )
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_200_OK)